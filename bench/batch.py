@@ -0,0 +1,67 @@
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+
+repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def run(size: int, queryCount: int, batchSize: int, embedLatency: float, seed: int) -> dict:
+    workdir = tempfile.mkdtemp(prefix="bench-batch-")
+    # caches are off so both paths pay for every query
+    with open(os.path.join(workdir, "serverSettings.json"), "w") as file:
+        json.dump({"embedCache": {"enabled": False}, "resultCache": {"enabled": False}, "embedBatching": {"enabled": False}}, file)
+    os.environ["SERVER_SETTINGS"] = os.path.join(workdir, "serverSettings.json")
+    os.chdir(workdir)
+    sys.path.insert(0, repo)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import catalog
+    import search
+    import chromadb as cdb
+    import src.embedding as embedding
+    import src.ingest as ingest
+    import src.shards as shards
+    import src.store as store
+
+    embedding.useBackend(catalog.HashEmbedder())
+    feed = os.path.join(workdir, "catalog.jsonl")
+    catalog.writeJsonl(feed, size, seed)
+    products = shards.openCollection(cdb.PersistentClient(), "products", embedding.OllamaEmbedder())
+    with contextlib.redirect_stdout(io.StringIO()):
+        ingest.streamIngest(products, store.openTextIndex(products), feed, upsert=False)
+
+    import src.process as process
+    embedding.useBackend(catalog.HashEmbedder(callLatency=embedLatency))
+    queries = search.sampleQueries(list(catalog.generate(size, seed)), queryCount, seed)
+    result: dict = {"size": size, "queries": queryCount, "batchSize": batchSize, "embedLatencyMs": embedLatency * 1000}
+    for exactOnly in [True, False]:
+        start = time.perf_counter()
+        for query in queries:
+            process.search(query, exactOnly)
+        looped = time.perf_counter() - start
+        start = time.perf_counter()
+        for offset in range(0, len(queries), batchSize):
+            process.searchBatch(queries[offset:offset + batchSize], exactOnly)
+        batched = time.perf_counter() - start
+        result["exactOnly" if exactOnly else "full"] = {"loopQueriesPerSecond": len(queries) / looped, "batchQueriesPerSecond": len(queries) / batched, "speedup": looped / batched}
+    shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compares looping over process.search() with process.searchBatch().")
+    parser.add_argument("--size", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--batch", type=int, default=100, help="queries per searchBatch() call")
+    parser.add_argument("--embedLatency", type=float, default=10, help="milliseconds added to every embedding call")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    result = run(args.size, args.queries, args.batch, args.embedLatency / 1000, args.seed)
+    print(f"{args.size} rows, {args.queries} queries in batches of {args.batch}, {args.embedLatency:g} ms per embedding call")
+    for mode in ["exactOnly", "full"]:
+        stats = result[mode]
+        print(f"    {mode:>9}: loop {stats["loopQueriesPerSecond"]:.0f} queries/s, batch {stats["batchQueriesPerSecond"]:.0f} queries/s ({stats["speedup"]:.1f}x)")
@@ -0,0 +1,69 @@
+import os
+import json
+import time
+import random
+import hashlib
+import numpy as np
+import chromadb as cdb
+from typing import Any, Iterator
+
+repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VARIANTS = ["Classic", "Deluxe", "Mini", "Max", "Lite", "Pro", "Plus", "Ultra", "Special", "Signature", "Grand", "Compact", "Iced", "Double", "Refurbished", "Limited"]
+EXTRA_TAGS = ["new", "sale", "bestseller", "seasonal", "bundle", "imported", "local", "gift", "eco", "premium"]
+EXTRA_SENTENCES = [
+    "Available in several sizes.",
+    "A favourite among regular customers.",
+    "Comes with a one year warranty.",
+    "Best enjoyed fresh.",
+    "Limited stock, while supplies last.",
+    "Ships within two working days.",
+    "Made to order on request.",
+    "Pairs well with the rest of the range.",
+]
+
+def templates() -> list[dict[str, Any]]:
+    loaded: list[dict[str, Any]] = []
+    for name in ["cafeData.json", "techData.json"]:
+        with open(os.path.join(repo, "src", name)) as file:
+            loaded.extend(json.load(file))
+    return loaded
+
+def generate(count: int, seed: int = 0) -> Iterator[dict[str, Any]]:
+    # variations on the test datasets, so names, tags and SKU prefixes look like the real catalog
+    rng = random.Random(seed)
+    bases = templates()
+    for i in range(count):
+        base = rng.choice(bases)
+        yield {
+            "name": f"{rng.choice(VARIANTS)} {base["name"]}",
+            "desc": f"{base["desc"]} {rng.choice(EXTRA_SENTENCES)}",
+            "sku": f"{base["sku"][:3].upper()}{i:07d}",
+            "price": round(base["price"] * rng.uniform(0.5, 3), 2),
+            "tags": base["tags"] + rng.sample(EXTRA_TAGS, 2),
+            "available": rng.random() > 0.15,
+        }
+
+def writeJsonl(path: str, count: int, seed: int = 0) -> None:
+    with open(path, "w") as file:
+        for record in generate(count, seed):
+            file.write(json.dumps(record) + "\n")
+
+class HashEmbedder(cdb.EmbeddingFunction):
+    # deterministic stand-in for OllamaEmbedder: hashed bag of words, so similar texts still land close together
+    def __init__(self, dimensions: int = 256, callLatency: float = 0) -> None:
+        self.dimensions = dimensions
+        # seconds added to every call, to stand in for the round trip to Ollama
+        self.callLatency = callLatency
+
+    def __call__(self, docs: cdb.Documents) -> cdb.Embeddings:
+        if self.callLatency > 0:
+            time.sleep(self.callLatency)
+        vectors: list[np.ndarray] = []
+        for doc in docs:
+            vector = np.zeros(self.dimensions, dtype=np.float32)
+            for token in doc.lower().replace(";", " ").split():
+                digest = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "little")
+                vector[digest % self.dimensions] += 1 if digest & (1 << 63) else -1
+            norm = np.linalg.norm(vector)
+            vectors.append(vector / norm if norm > 0 else vector)
+        return vectors
@@ -0,0 +1,78 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+import numpy as np
+
+repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo)
+from src.models import ProductData, decomposeTags
+from src.ranking import fuse, materialise, pageOf
+
+# compares building results the old way (validate every hit, dedupe with set(), sort five times)
+# with columns fused and selected once by fuse()
+def syntheticMatches(count: int, seed: int = 0) -> tuple[list[dict], list[float], list[dict], list[float]]:
+    rng = random.Random(seed)
+    templates: list[dict] = []
+    for name in ["cafeData.json", "techData.json"]:
+        with open(os.path.join(repo, "src", name)) as file:
+            templates.extend(json.load(file))
+    metadatas: list[dict] = []
+    for i in range(count):
+        meta = dict(rng.choice(templates))
+        meta["sku"] = f"{meta["sku"]}-{i}"
+        meta["tags"] = ";".join(meta["tags"])
+        meta["available"] = rng.random() > 0.2
+        metadatas.append(meta)
+    distances = [rng.random() for _ in range(count)]
+    # a tenth of the candidates are direct matches, some of which the embedding search also found
+    directCount = max(1, count // 10)
+    return metadatas, distances, metadatas[:directCount], distances[:directCount]
+
+def oldPath(metadatas: list[dict], distances: list[float], directMetas: list[dict], directDistances: list[float]) -> list[ProductData]:
+    embeddingInfos = [ProductData.model_validate(decomposeTags(meta)) for meta in metadatas]
+    directInfos = [ProductData.model_validate(decomposeTags(meta)) for meta in directMetas]
+    embeddingInfos = list(set(embeddingInfos) - set(directInfos))
+    infosList = [(embeddingInfos[i], distances[i]) for i in range(len(embeddingInfos))]
+    directsList = [(directInfos[i], directDistances[i]) for i in range(len(directInfos))]
+    infosList.sort(key=lambda t: t[1])
+    infosList.sort(key=lambda t: int(t[0].available), reverse=True)
+    directsList.sort(key=lambda t: t[1])
+    directsList.sort(key=lambda t: int(t[0].available), reverse=True)
+    finalList = [t[0] for t in directsList + infosList][:10]
+    finalList.sort(key=lambda pd: int(pd.available), reverse=True)
+    return finalList
+
+def newPath(metadatas: list[dict], distances: list[float], directMetas: list[dict], directDistances: list[float]) -> list[ProductData]:
+    # the same columns rankCandidates hands to fuse, direct matches first
+    direct = {str(meta["sku"]) for meta in directMetas}
+    others = [i for i, meta in enumerate(metadatas) if meta["sku"] not in direct]
+    ids = [str(meta["sku"]) for meta in directMetas] + [str(metadatas[i]["sku"]) for i in others]
+    metas = directMetas + [metadatas[i] for i in others]
+    exact = np.concatenate([np.ones(len(directMetas)), np.zeros(len(others))])
+    lexical = np.concatenate([np.ones(len(directMetas)), np.zeros(len(others))])
+    allDistances = np.concatenate([np.asarray(directDistances, dtype=np.float64), np.asarray(distances, dtype=np.float64)[others]])
+    return materialise(pageOf(fuse(ids, metas, exact, lexical, allDistances, 10), 0, 10))
+
+def timeIt(function, args: tuple, repeats: int) -> float:
+    times: list[float] = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark result materialisation.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        matches = syntheticMatches(size)
+        old = timeIt(oldPath, matches, args.repeats)
+        new = timeIt(newPath, matches, args.repeats)
+        print(f"{size:>6} candidates: old {old * 1000:8.2f} ms, new {new * 1000:8.2f} ms ({old / new:.1f}x)")
@@ -0,0 +1,58 @@
+import os
+import sys
+import random
+import argparse
+import numpy as np
+
+repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from materialise import syntheticMatches, timeIt
+from src.config import RankingSettings
+from src.ranking import fuse
+
+# compares the old ranking (two dicts, each list sorted twice, concatenated, truncated and sorted again)
+# with one fused score per candidate and a heap top-k, on the same raw matches
+def signals(count: int, seed: int = 0) -> tuple[list[dict], list[float], list[dict], list[float], list[float]]:
+    metadatas, distances, directMetas, directDistances = syntheticMatches(count, seed)
+    rng = random.Random(seed)
+    return metadatas, distances, directMetas, directDistances, [rng.uniform(0, 20) for _ in directMetas]
+
+def oldPath(metadatas: list[dict], distances: list[float], directMetas: list[dict], directDistances: list[float], bm25: list[float], k: int) -> list[str]:
+    directs = {str(meta["sku"]): (meta, distance) for meta, distance in zip(directMetas, directDistances)}
+    infos = {str(meta["sku"]): (meta, distance) for meta, distance in zip(metadatas, distances) if meta["sku"] not in directs}
+    infosList = list(infos.items())
+    directsList = list(directs.items())
+    infosList.sort(key=lambda t: t[1][1])
+    infosList.sort(key=lambda t: int(bool(t[1][0]["available"])), reverse=True)
+    directsList.sort(key=lambda t: t[1][1])
+    directsList.sort(key=lambda t: int(bool(t[1][0]["available"])), reverse=True)
+    finalList = (directsList + infosList)[:k]
+    finalList.sort(key=lambda t: int(bool(t[1][0]["available"])), reverse=True)
+    return [id for id, _ in finalList]
+
+def fusedPath(metadatas: list[dict], distances: list[float], directMetas: list[dict], directDistances: list[float], bm25: list[float], k: int, weights: RankingSettings) -> list[str]:
+    directIds = [str(meta["sku"]) for meta in directMetas]
+    direct = set(directIds)
+    others = [i for i, meta in enumerate(metadatas) if meta["sku"] not in direct]
+    ids = directIds + [str(metadatas[i]["sku"]) for i in others]
+    exact = np.concatenate([np.ones(len(directIds)), np.zeros(len(others))])
+    lexical = np.concatenate([np.asarray(bm25), np.zeros(len(others))])
+    fusedDistances = np.concatenate([np.asarray(directDistances), np.asarray(distances)[others]])
+    return [c.id for c in fuse(ids, directMetas + [metadatas[i] for i in others], exact, lexical, fusedDistances, k, weights)]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the ranking stage.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--k", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    weighted = RankingSettings(method="weighted")
+    rrf = RankingSettings(method="rrf")
+    for size in args.sizes:
+        matches = signals(size)
+        old = timeIt(oldPath, (*matches, args.k), args.repeats)
+        fused = timeIt(fusedPath, (*matches, args.k, weighted), args.repeats)
+        fusedRrf = timeIt(fusedPath, (*matches, args.k, rrf), args.repeats)
+        print(f"{size:>7} candidates: old {old * 1000:8.2f} ms, weighted {fused * 1000:8.2f} ms ({old / fused:.1f}x), rrf {fusedRrf * 1000:8.2f} ms ({old / fusedRrf:.1f}x)")
@@ -0,0 +1,164 @@
+import io
+import os
+import asyncio
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import contextlib
+import numpy as np
+
+repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NATURAL_QUERIES = [
+    "something warm to drink in the morning",
+    "a cheap phone for my parents",
+    "sweet dessert with ice cream",
+    "tablet for reading on the train",
+    "light lunch with rice",
+    "strong black coffee without milk",
+    "newest samsung phone",
+    "savoury breakfast pastry with cheese",
+]
+
+def percentiles(latencies: list[float]) -> dict[str, float]:
+    milliseconds = np.array(latencies) * 1000
+    return {"p50": float(np.percentile(milliseconds, 50)), "p95": float(np.percentile(milliseconds, 95)), "p99": float(np.percentile(milliseconds, 99))}
+
+def sampleQueries(records: list[dict], count: int, seed: int) -> list[str]:
+    # a mix of single words, tags, SKUs and natural language, like real traffic
+    rng = random.Random(seed)
+    queries: list[str] = []
+    for _ in range(count):
+        record = rng.choice(records)
+        kind = rng.random()
+        if kind < 0.35:
+            queries.append(rng.choice(record["name"].split()))
+        elif kind < 0.6:
+            queries.append(rng.choice(record["tags"]))
+        elif kind < 0.7:
+            queries.append(record["sku"])
+        else:
+            queries.append(rng.choice(NATURAL_QUERIES))
+    return queries
+
+def nameQueries(records: list[dict], count: int, seed: int) -> list[str]:
+    # whole product names: too long to skip the embedder, but with direct matches to stream ahead of it
+    rng = random.Random(seed)
+    return [rng.choice(records)["name"] for _ in range(count)]
+
+def runSize(size: int, queryCount: int, seed: int, batching: bool, shardCount: int, embedLatency: float) -> dict:
+    workdir = tempfile.mkdtemp(prefix="bench-search-")
+    # caches are off so every query pays for the whole pipeline
+    with open(os.path.join(workdir, "serverSettings.json"), "w") as file:
+        json.dump({"embedCache": {"enabled": False}, "resultCache": {"enabled": False}, "embedBatching": {"enabled": batching}, "shards": {"count": shardCount}}, file)
+    os.environ["SERVER_SETTINGS"] = os.path.join(workdir, "serverSettings.json")
+    os.chdir(workdir)
+    sys.path.insert(0, repo)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import catalog
+    import chromadb as cdb
+    import src.embedding as embedding
+    import src.ingest as ingest
+    import src.shards as shards
+    import src.store as store
+
+    embedding.useBackend(catalog.HashEmbedder())
+    feed = os.path.join(workdir, "catalog.jsonl")
+    catalog.writeJsonl(feed, size, seed)
+    chroma = cdb.PersistentClient()
+    products = shards.openCollection(chroma, "products", embedding.OllamaEmbedder())
+    index = store.openTextIndex(products)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        ingest.streamIngest(products, index, feed, upsert=False)
+    ingestSeconds = time.perf_counter() - start
+
+    import src.process as process
+    embedding.useBackend(catalog.HashEmbedder(callLatency=embedLatency))
+    records = list(catalog.generate(size, seed))
+    queries = sampleQueries(records, queryCount, seed)
+    result: dict = {"size": size, "shards": shardCount, "ingest": {"seconds": ingestSeconds, "rowsPerSecond": size / ingestSeconds}}
+    for exactOnly in [True, False]:
+        for query in queries[:10]:
+            process.search(query, exactOnly)
+        latencies: list[float] = []
+        start = time.perf_counter()
+        for query in queries:
+            queryStart = time.perf_counter()
+            process.search(query, exactOnly)
+            latencies.append(time.perf_counter() - queryStart)
+        elapsed = time.perf_counter() - start
+        result["exactOnly" if exactOnly else "full"] = percentiles(latencies) | {"queriesPerSecond": len(queries) / elapsed}
+    result["stream"] = {}
+    for mix, mixQueries in [("traffic", queries), ("names", nameQueries(records, queryCount, seed))]:
+        firstResults, completions, exactFirst = asyncio.run(streamed(process, mixQueries))
+        result["stream"][mix] = {"firstResult": percentiles(firstResults), "complete": percentiles(completions), "exactFirst": exactFirst}
+    shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+async def streamed(process, queries: list[str]) -> tuple[list[float], list[float], int]:
+    # time to the first streamed row, and to the end of the stream, of full searches
+    firstResults: list[float] = []
+    completions: list[float] = []
+    exactFirst = 0
+    for query in queries:
+        start = time.perf_counter()
+        first = None
+        async for kind, products in process.searchStream(query, False):
+            if first is None and len(products) > 0:
+                first = time.perf_counter() - start
+                exactFirst += kind == "exact"
+        completions.append(time.perf_counter() - start)
+        firstResults.append(first if first is not None else completions[-1])
+    return firstResults, completions, exactFirst
+
+def gitRevision() -> str:
+    result = subprocess.run(["git", "-C", repo, "rev-parse", "--short", "HEAD"], capture_output=True, text=True)
+    return result.stdout.strip() or "unknown"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline search benchmark on synthetic catalogs.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batching", action="store_true", help="keep the embedding micro-batcher on")
+    parser.add_argument("--shards", type=int, default=1, help="split the catalog over this many collections")
+    parser.add_argument("--embedLatency", type=float, default=0, help="milliseconds added to every embedding call")
+    parser.add_argument("--output", default=os.path.join(repo, "bench", "results"))
+    parser.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single is not None:
+        print(json.dumps(runSize(args.single, args.queries, args.seed, args.batching, args.shards, args.embedLatency / 1000)))
+        sys.exit()
+
+    # each size runs in its own interpreter, since the search runtime binds its store on import
+    results: list[dict] = []
+    for size in args.sizes:
+        command = [sys.executable, __file__, "--single", str(size), "--queries", str(args.queries), "--seed", str(args.seed), "--shards", str(args.shards), "--embedLatency", str(args.embedLatency)] + (["--batching"] if args.batching else [])
+        run = subprocess.run(command, capture_output=True, text=True)
+        if run.returncode != 0:
+            print(f"{size} rows: failed\n{run.stderr}")
+            continue
+        result = json.loads(run.stdout.strip().splitlines()[-1])
+        results.append(result)
+        print(f"{size} rows: ingest {result["ingest"]["rowsPerSecond"]:.0f} rows/s")
+        for mode in ["exactOnly", "full"]:
+            stats = result[mode]
+            print(f"    {mode:>9}: p50 {stats["p50"]:.2f} ms, p95 {stats["p95"]:.2f} ms, p99 {stats["p99"]:.2f} ms, {stats["queriesPerSecond"]:.0f} queries/s")
+        for mix, streams in result["stream"].items():
+            for stage in ["firstResult", "complete"]:
+                stats = streams[stage]
+                print(f"    {mix + " stream " + stage:>28}: p50 {stats["p50"]:.2f} ms, p95 {stats["p95"]:.2f} ms, p99 {stats["p99"]:.2f} ms")
+            print(f"    {streams["exactFirst"]} of {args.queries} {mix} streams sent exact matches ahead of the ranked page")
+
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"search-{time.strftime("%Y%m%d-%H%M%S")}.json")
+    with open(path, "w") as file:
+        json.dump({"revision": gitRevision(), "python": platform.python_version(), "machine": platform.machine(), "queries": args.queries, "seed": args.seed, "shards": args.shards, "embedLatencyMs": args.embedLatency, "results": results}, file, indent=2)
+    print(f"Saved to {path}")
@@ -0,0 +1,55 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+# measures how long the server takes to import, and whether it drags in the ingest-only dependencies
+HEAVY_MODULES = ["tkinter", "unstructured", "pymupdf"]
+PROBE = f"""
+import sys, json, time
+start = time.perf_counter()
+import server
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "heavy": sorted({{m.split(".")[0] for m in sys.modules}} & set({HEAVY_MODULES!r}))}}))
+"""
+repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def measure(tree: str, runs: int) -> dict[str, object]:
+    times: list[float] = []
+    heavy: list[str] = []
+    with tempfile.TemporaryDirectory() as workdir:
+        # a scratch working directory, so the probe's database and text index don't touch real ones
+        env = os.environ | {"PYTHONPATH": tree}
+        for _ in range(runs):
+            result = subprocess.run([sys.executable, "-c", PROBE], cwd=workdir, env=env, capture_output=True, text=True)
+            if result.returncode != 0:
+                lines = result.stderr.strip().splitlines()
+                return {"tree": tree, "error": lines[-1] if len(lines) > 0 else f"exit code {result.returncode}"}
+            report = json.loads(result.stdout.strip().splitlines()[-1])
+            times.append(report["seconds"])
+            heavy = report["heavy"]
+    return {"tree": tree, "runs": runs, "median": statistics.median(times), "min": min(times), "max": max(times), "heavyModules": heavy}
+
+def checkout(revision: str, into: str) -> str:
+    archive = subprocess.run(["git", "-C", repo, "archive", revision], capture_output=True, check=True)
+    subprocess.run(["tar", "-x", "-C", into], input=archive.stdout, check=True)
+    return into
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark server import time.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--baseline", help="git revision to compare against, e.g. HEAD~1")
+    args = parser.parse_args()
+
+    results = [measure(repo, args.runs)]
+    if args.baseline is not None:
+        with tempfile.TemporaryDirectory() as baseline:
+            results.append(measure(checkout(args.baseline, baseline), args.runs) | {"tree": args.baseline})
+    for result in results:
+        if "error" in result:
+            print(f"{result["tree"]}: failed to import ({result["error"]})")
+        else:
+            print(f"{result["tree"]}: median {result["median"] * 1000:.0f} ms over {result["runs"]} runs, heavy modules loaded: {", ".join(result["heavyModules"]) or "none"}") # type: ignore
@@ -0,0 +1,58 @@
+import os
+import sys
+import time
+import random
+import argparse
+import numpy as np
+
+repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import catalog
+from search import percentiles
+from src.models import ProductData
+from src.suggest import PrefixIndex
+from src.textindex import TextIndex
+
+# feeds the prefix index through the same hook the text index uses, without the rest of the text index
+def samplePrefixes(records: list[dict], count: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    prefixes: list[str] = []
+    for _ in range(count):
+        record = rng.choice(records)
+        text = rng.choice([record["name"], rng.choice(record["tags"]), record["sku"]])
+        prefixes.append(text[:rng.randint(1, min(len(text), 8))])
+    return prefixes
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark /suggest/ completions on a synthetic catalog.")
+    parser.add_argument("--size", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=10000)
+    parser.add_argument("--updates", type=int, default=10000, help="products upserted one by one after the initial build")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    records = list(catalog.generate(args.size + args.updates, args.seed))
+    index = PrefixIndex()
+    start = time.perf_counter()
+    for record in records[:args.size]:
+        TextIndex.suggestions(record["sku"], ProductData.model_validate(record).toDB().metadata, index.add)
+    built = time.perf_counter() - start
+    print(f"{args.size} products: built in {built:.1f} s ({args.size / built:.0f} products/s), {len(index)} completions")
+
+    start = time.perf_counter()
+    for record in records[args.size:]:
+        TextIndex.suggestions(record["sku"], ProductData.model_validate(record).toDB().metadata, index.add)
+    updated = time.perf_counter() - start
+    print(f"{args.updates} incremental upserts: {updated / args.updates * 1e6:.1f} us each")
+
+    prefixes = samplePrefixes(records, args.queries, args.seed)
+    for prefix in prefixes[:100]:
+        index.complete(prefix)
+    latencies: list[float] = []
+    for prefix in prefixes:
+        queryStart = time.perf_counter()
+        index.complete(prefix)
+        latencies.append(time.perf_counter() - queryStart)
+    stats = percentiles(latencies)
+    print(f"complete(): p50 {stats["p50"]:.3f} ms, p95 {stats["p95"]:.3f} ms, p99 {stats["p99"]:.3f} ms, max {np.max(latencies) * 1000:.3f} ms")
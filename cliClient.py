@@ -3,7 +3,7 @@ import copy
 import inspect as insp
 import requests as req
 import pydantic as pyd
-import src.database as src
+import src.models as src
 from abc import ABC, abstractmethod
 from typing import Callable, NamedTuple
 
@@ -75,9 +75,24 @@ class SearchMenu(Menu[NoContext]):
     @classmethod
     def choose(cls, env:" CLI", context, choice: str):
         try:
-            resultJsons: list[dict[str, object]] = req.get(f"http://127.0.0.1:8000/search/", {"query": choice, "exactOnly": env.settings.exactOnly}).json()
-            result = [src.ProductData.model_validate(d) for d in resultJsons]
-            env.substituteMenu(ResultsDisplayMenu, ResultsDisplayMenuContext(result))
+            # rows are printed as they arrive, so exact matches show before the recommendations are ranked
+            result: list[src.ProductData] = []
+            kind = None
+            with env.session.get(SERVER_URL + "/search/stream", params={"query": choice, "exactOnly": env.settings.exactOnly}, stream=True) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    streamed = src.StreamedResult.model_validate_json(line)
+                    if streamed.product is None:
+                        print(streamed.detail)
+                        break
+                    if streamed.kind == "ranked" and kind == "exact":
+                        print("More results:")
+                    kind = streamed.kind
+                    result.append(streamed.product)
+                    print(f"{len(result)}. {streamed.product.name}")
+            env.substituteMenu(ResultsDisplayMenu, ResultsDisplayMenuContext(result, rendered=True))
             return
         except req.ConnectionError as e:
             import urllib3.exceptions as excs
@@ -85,25 +100,31 @@ class SearchMenu(Menu[NoContext]):
                 print("Connection could not be made.")
             else:
                 print(f"Connection error: {e}")
+        except req.RequestException as e:
+            print(f"Search failed: {e}")
         env.back()
 
 class ResultsDisplayMenuContext(NamedTuple):
     results: list[src.ProductData]
+    # already printed while they streamed in
+    rendered: bool = False
 class ResultsDisplayMenu(Menu[ResultsDisplayMenuContext]):
     @classmethod
     def display(cls, env: "CLI", context) -> str:
-        length = 0
-        for ind, pd in enumerate(context.results):
-            print(f"{ind + 1}. {pd.name}")
-            length = ind
-        print(f"{length + 2}. Back")
+        length = len(context.results)
+        if not context.rendered:
+            for ind, pd in enumerate(context.results):
+                print(f"{ind + 1}. {pd.name}")
+        print(f"{length + 1}. Back")
         print("Enter option >>> ", end="")
-        return Menu.loop([Menu.isInt, Menu.strInRange(1, length + 2)])
+        return Menu.loop([Menu.isInt, Menu.strInRange(1, length + 1)])
     
     @classmethod
     def choose(cls, env: "CLI", context, choice: str):
        for ind, pd in enumerate(context.results):
            if str(ind + 1) == choice:
+               # coming back to the list prints it again
+               env.context = context._replace(rendered=False)
                env.switchMenu(PDDisplayMenu, PDDisplayMenuContext(pd))
                return
        env.back()
@@ -164,6 +185,7 @@ class SettingsExactOnlyMenu(Menu[NoContext]):
 class Settings(pyd.BaseModel):
     exactOnly: bool = False
 
+SERVER_URL = "http://127.0.0.1:8000"
 SETTINGS_FILE = "/settings.json"
 dir = os.path.dirname(os.path.abspath(__file__))
 class CLI:
@@ -174,6 +196,8 @@ class CLI:
         self.running: bool = False
         self.settingsPath = dir + SETTINGS_FILE
         self.settingsChanged: bool = False
+        # one pooled keep-alive connection for every search, instead of a new one each time
+        self.session = req.Session()
         if os.path.isfile(self.settingsPath):
             with open(self.settingsPath, "r") as file:
                 try:
@@ -1,13 +1,116 @@
+import asyncio
 import fastapi as fast
+
+if __name__ == "__main__":
+    import sys
+    import uvicorn
+    from src.config import settings
+
+    # workers are separate processes that import the app by name, so this one only supervises them and never loads the catalog itself
+    uvicorn.run("server:app", port=8000, workers=settings.processes)
+    sys.exit()
+
 import src.process as src
+import src.embedding as embedding
+import src.metrics as metrics
+from typing import AsyncIterator, Coroutine
 
 app = fast.FastAPI()
 
+async def disconnected(request: fast.Request) -> None:
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+async def unlessDisconnected[T](request: fast.Request, work: Coroutine[None, None, T]) -> T:
+    # stop working on a search as soon as the client that asked for it goes away
+    task = asyncio.ensure_future(work)
+    watcher = asyncio.ensure_future(disconnected(request))
+    try:
+        await asyncio.wait([task, watcher], return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+    if not task.done():
+        task.cancel()
+        raise fast.HTTPException(499, "Client disconnected.")
+    return task.result()
+
+def searchFilters(
+    minPrice: float | None = fast.Query(None, ge=0),
+    maxPrice: float | None = fast.Query(None, ge=0),
+    tag: list[str] = fast.Query([]),
+    excludeTag: list[str] = fast.Query([]),
+    available: bool | None = None,
+) -> src.SearchFilters:
+    return src.SearchFilters(minPrice=minPrice, maxPrice=maxPrice, tags=tag, excludeTags=excludeTag, available=available)
+
 @app.get("/search/")
-async def search(query: str, exactOnly: bool) -> list[src.ProductData]:
-    return src.search(query, exactOnly)
+async def search(
+    request: fast.Request,
+    response: fast.Response,
+    query: str,
+    exactOnly: bool,
+    limit: int = fast.Query(10, ge=1, le=100),
+    offset: int = fast.Query(0, ge=0),
+    candidates: int | None = fast.Query(None, ge=1, le=src.MAX_CANDIDATES),
+    cursor: str | None = None,
+    filters: src.SearchFilters = fast.Depends(searchFilters),
+) -> list[src.ProductData]:
+    with metrics.request() as trace:
+        try:
+            page = await unlessDisconnected(request, src.searchAsync(query, exactOnly, limit, offset, candidates, cursor, filters))
+        except asyncio.TimeoutError:
+            raise fast.HTTPException(504, "Search timed out.")
+        except src.CursorExpired:
+            raise fast.HTTPException(410, "Cursor expired or invalid, search again.")
+    # per-request breakdown, only for clients that ask for it
+    if "X-Trace" in request.headers:
+        response.headers["Server-Timing"] = trace.serverTiming()
+        response.headers["X-Search-Trace"] = trace.summary()
+    if (route := trace.route()) is not None:
+        response.headers["X-Search-Route"] = route
+    if page.cursor is not None:
+        response.headers["X-Next-Cursor"] = page.cursor
+    return page.results
 
-if __name__ == "__main__":
-    import uvicorn
-    
-    uvicorn.run(app, port=8000)
\ No newline at end of file
+@app.get("/search/stream")
+async def searchStream(
+    query: str,
+    exactOnly: bool,
+    limit: int = fast.Query(10, ge=1, le=100),
+    candidates: int | None = fast.Query(None, ge=1, le=src.MAX_CANDIDATES),
+    filters: src.SearchFilters = fast.Depends(searchFilters),
+) -> fast.responses.StreamingResponse:
+    async def lines() -> AsyncIterator[str]:
+        # the status is sent with the first line, so a failure part way through becomes a line of its own
+        with metrics.request():
+            try:
+                async for kind, products in src.searchStream(query, exactOnly, limit, candidates, filters):
+                    for product in products:
+                        yield src.StreamedResult(kind=kind, product=product).model_dump_json() + "\n"
+            except asyncio.TimeoutError:
+                yield src.StreamedResult(kind="error", detail="Search timed out.").model_dump_json() + "\n"
+    return fast.responses.StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.post("/search/batch")
+async def searchBatch(request: fast.Request, batch: src.BatchSearch) -> list[src.BatchResult]:
+    if len(batch.queries) > src.settings.search.maxBatchQueries:
+        raise fast.HTTPException(413, f"At most {src.settings.search.maxBatchQueries} queries per batch.")
+    pages = await unlessDisconnected(request, src.searchBatchAsync(batch.queries, batch.exactOnly, batch.limit, batch.candidates, batch.filters))
+    return [src.BatchResult(query=query, results=page.results, cursor=page.cursor) for query, page in zip(batch.queries, pages)]
+
+@app.get("/suggest/")
+async def suggest(prefix: str, limit: int = fast.Query(10, ge=1, le=50)) -> list[src.Suggestion]:
+    # off the event loop, since the first call after a catalog write reloads the text index
+    return await src.stage(src.suggest, prefix, limit, timeout=src.settings.search.textTimeout)
+
+@app.get("/stats/")
+async def stats() -> dict[str, dict[str, int]]:
+    return {
+        "embeddingCache": embedding.queryCache.stats() if embedding.queryCache is not None else {},
+        "embeddingBatcher": embedding.batcher.stats() if embedding.batcher is not None else {},
+        "resultCache": src.resultCache.stats() if src.resultCache is not None else {},
+    }
+
+@app.get("/metrics")
+async def prometheusMetrics() -> fast.responses.PlainTextResponse:
+    return fast.responses.PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,56 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+class LRUCache[K, V]:
+    def __init__(self, maxBytes: int, ttlSeconds: float | None = None, sizeOf: Callable[[K, V], int] = lambda k, v: 1) -> None:
+        self.maxBytes = maxBytes
+        self.ttlSeconds = ttlSeconds
+        self.sizeOf = sizeOf
+        self.entries: OrderedDict[K, tuple[V, float, int]] = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: K) -> V | None:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, created, size = entry
+            if self.ttlSeconds is not None and time.monotonic() - created > self.ttlSeconds:
+                del self.entries[key]
+                self.bytes -= size
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: K, value: V) -> None:
+        size = self.sizeOf(key, value)
+        if size > self.maxBytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[2]
+            self.entries[key] = (value, time.monotonic(), size)
+            self.bytes += size
+            while self.bytes > self.maxBytes:
+                _, (_, _, evictedSize) = self.entries.popitem(last=False)
+                self.bytes -= evictedSize
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict[str, int]:
+        with self.lock:
+            return {"entries": len(self.entries), "bytes": self.bytes, "maxBytes": self.maxBytes, "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
@@ -0,0 +1,92 @@
+import os
+import pydantic as pyd
+from typing import Literal
+
+class EmbedCacheSettings(pyd.BaseModel):
+    enabled: bool = True
+    maxBytes: int = 64 * 1024 * 1024
+    ttlSeconds: float = 7 * 24 * 60 * 60
+    diskPath: str | None = None
+
+class EmbedBatchSettings(pyd.BaseModel):
+    enabled: bool = True
+    maxWaitMs: float = 5
+    maxBatchSize: int = 32
+    concurrency: int = 2
+
+class ResultCacheSettings(pyd.BaseModel):
+    enabled: bool = True
+    maxBytes: int = 32 * 1024 * 1024
+    ttlSeconds: float = 60 * 60
+
+class SearchSettings(pyd.BaseModel):
+    workers: int = 8
+    textTimeout: float = 2.0
+    embedTimeout: float = 5.0
+    vectorTimeout: float = 5.0
+    batchChunk: int = 64
+    maxBatchQueries: int = 1000
+    textIndexPollSeconds: float = 1.0
+
+class IngestSettings(pyd.BaseModel):
+    chunkSize: int = 256
+    inFlight: int = 3
+    checkpointEvery: int = 8
+    retries: int = 3
+
+class RouterSettings(pyd.BaseModel):
+    enabled: bool = True
+    keywordMaxTokens: int = 2
+
+class RankingSettings(pyd.BaseModel):
+    method: Literal["weighted", "rrf"] = "weighted"
+    exact: float = 1.0
+    lexical: float = 0.5
+    similarity: float = 1.0
+    available: float = 0.25
+    rrfK: float = 60
+
+class DocumentSettings(pyd.BaseModel):
+    workers: int = max((os.cpu_count() or 2) - 1, 1)
+    pagesInFlight: int = 16
+
+class ShardSettings(pyd.BaseModel):
+    count: int = 1
+    by: Literal["hash", "prefix"] = "hash"
+    prefixLength: int = 3
+
+class FlatStoreSettings(pyd.BaseModel):
+    path: str = "./flatStore"
+    dtype: Literal["float32", "float16", "int8"] = "float16"
+
+class ServerSettings(pyd.BaseModel):
+    embeddingModel: str = "embeddinggemma"
+    # uvicorn worker processes for server.py
+    processes: int = 1
+    embedCache: EmbedCacheSettings = pyd.Field(default_factory=EmbedCacheSettings)
+    embedBatching: EmbedBatchSettings = pyd.Field(default_factory=EmbedBatchSettings)
+    textIndexPath: str = "./textIndex.pkl"
+    catalogVersionPath: str = "./catalogVersion"
+    resultCache: ResultCacheSettings = pyd.Field(default_factory=ResultCacheSettings)
+    search: SearchSettings = pyd.Field(default_factory=SearchSettings)
+    ranking: RankingSettings = pyd.Field(default_factory=RankingSettings)
+    router: RouterSettings = pyd.Field(default_factory=RouterSettings)
+    ingest: IngestSettings = pyd.Field(default_factory=IngestSettings)
+    documents: DocumentSettings = pyd.Field(default_factory=DocumentSettings)
+    vectorBackend: Literal["chroma", "flat"] = "chroma"
+    shards: ShardSettings = pyd.Field(default_factory=ShardSettings)
+    flatStore: FlatStoreSettings = pyd.Field(default_factory=FlatStoreSettings)
+
+SETTINGS_FILE = "/serverSettings.json"
+dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+def loadSettings() -> ServerSettings:
+    path = os.environ.get("SERVER_SETTINGS", dir + SETTINGS_FILE)
+    if os.path.isfile(path):
+        with open(path, "r") as file:
+            try:
+                return ServerSettings.model_validate_json(file.read())
+            except pyd.ValidationError:
+                print("Malformed server settings, using defaults...")
+    return ServerSettings()
+
+settings = loadSettings()
@@ -1,64 +1,42 @@
+import os
 import json
-import numpy as np
-import tkinter as tk
-import ollama as ollm
-import chromadb as cdb
 import pydantic as pyd
+import chromadb as cdb
 from typing import Any, Literal
-from tkinter import filedialog as fd
-import unstructured.documents.elements as unstels
-
-root = tk.Tk()
-root.withdraw()
-root.call('wm', 'attributes', '.', '-topmost', True)
-
-class OllamaEmbedder(cdb.EmbeddingFunction):
-    def __init__(self, *args: Any, **kwargs: Any) -> None:
-        super().__init__(*args, **kwargs)
-
-    def __call__(self, docs: cdb.Documents) -> cdb.Embeddings:
-        vectors = ollm.embed("embeddinggemma", docs).embeddings
-        return [np.array(v, dtype=np.float32) for v in vectors]
-    
-class ProductData(pyd.BaseModel):
-    name: str
-    desc: str
-    sku: str
-    price: float
-    tags: list[str]
-    available: bool = True
+try:
+    from src.models import *
+    from src.config import settings
+    from src.documents import extractProductDataUnst
+    from src.embedding import OllamaEmbedder
+    from src.flatstore import FlatStore
+    from src.shards import deleteCollection, openCollection
+    from src.snapshot import exportSnapshot, loadSnapshot, restoreSnapshot
+    from src.store import catalogVersion, openTextIndex, writeEntries
+except ModuleNotFoundError:
+    from models import *
+    from config import settings
+    from documents import extractProductDataUnst
+    from embedding import OllamaEmbedder
+    from flatstore import FlatStore
+    from shards import deleteCollection, openCollection
+    from snapshot import exportSnapshot, loadSnapshot, restoreSnapshot
+    from store import catalogVersion, openTextIndex, writeEntries
 
-    def matches(self, to: str) -> bool:
-        l = to.lower()
-        return l in self.name.lower() or l in self.desc.lower() or l in self.tags
-    
-    def text(self) -> str:
-        return f"NAME: {self.name.lower()}; DESCRIPTION: {self.desc.lower()}; TAGS: {";".join(self.tags).lower()}"
+# GUI and document parsing dependencies are only loaded once a command needs them
+root = None
+def fileDialogs():
+    global root
+    import tkinter as tk
+    from tkinter import filedialog as fd
+    if root is None:
+        root = tk.Tk()
+        root.withdraw()
+        root.call('wm', 'attributes', '.', '-topmost', True)
+    return fd
 
-    def toDB(self):
-        dump = self.model_dump()
-        dump["tags"] = ";".join(self.tags)
-        return DBProductData(id=self.sku, text=self.text(), metadata=dump)
-    
-    def __hash__(self) -> int:
-        return hash(self.model_dump_json())
-    
-class DataPart:
-    def __init__(self, name: str | None = None, desc: str | None = None, sku: str = "", price: float | None = None, tags: list[str] = [], available: bool = True) -> None:
-        self.name = name
-        self.desc = desc
-        self.sku = sku
-        self.price = price
-        self.tags = tags
-        self.available = available
-
-    def toData(self) -> ProductData:
-        if self.name == None or self.desc == None or self.price == None:
-            raise TypeError("Missing fields.")
-        return ProductData(name=self.name, desc=self.desc, sku=self.sku, price=self.price, tags=self.tags, available=self.available)
-    
 def pdfParseUnst() -> None:
     import unstructured.partition.pdf as unstpdf
+    fd = fileDialogs()
     file = fd.askopenfile("rb", filetypes=[("PDF", "*.pdf")])
     pdf = unstpdf.partition_pdf(file=file, strategy="auto", languages=["eng"], extract_image_block_types=["Image", "Table"])
     productDataUnst = extractProductDataUnst(pdf)
@@ -66,49 +44,17 @@ def pdfParseUnst() -> None:
 
 def imgParseUnst() -> None:
     import unstructured.partition.image as unstimg
+    fd = fileDialogs()
     file = fd.askopenfile("rb", filetypes=[("Image (PNG)", "*.png"), ("Image (HEIC)", "*.heic"), ("Image (JPG)", "*.jpg"), ("Image (JPEG)", "*.jpeg")])
     img = unstimg.partition_image(file=file, strategy="hi_res", languages=["eng"], extract_image_block_types=["Image", "Table"])
     productDataUnst = extractProductDataUnst(img)
     print(productDataUnst)
 
-def extractProductDataUnst(elements: list[unstels.Element]) -> list[ProductData]:
-    prices: list[float] = []
-    last: unstels.Element = elements[0]
-    parts: list[DataPart] = []
-    part = DataPart()
-    titleEncountered: bool = False
-    for el in elements:
-        eltype = type(el)
-        if el.text == last.text and type(last) == unstels.Title and eltype == unstels.Text:
-            continue
-        match eltype:
-            case unstels.Title:
-                part.name = el.text
-                titleEncountered = True
-            case unstels.Text | unstels.ListItem | unstels.NarrativeText:
-                if not titleEncountered:
-                    continue
-                try:
-                    prices.append(int(el.text))
-                except ValueError:
-                    if part.desc == None:
-                        part.desc = ""
-                    part.desc += " " + el.text
-            case _:
-                print(f"Unknown element type: {eltype}, containing \"{el.text}\"")
-        last = el
-        if part.name != None and part.desc != None:
-            parts.append(part)
-            part = DataPart()
-    priceNum = len(prices)
-    for ind, part in enumerate(parts):
-        part.price = prices[ind] if ind < priceNum else 0
-    return [dp.toData() for dp in parts]
-
 def pdfParseMu() -> None:
     import pymupdf as pymu
     import pymupdf.layout as _
     import pymupdf4llm as pymul
+    fd = fileDialogs()
     file = fd.askopenfilename(filetypes=[("PDF", "*.pdf")])
     pdf = pymu.open(file)
     productDataMu = pymul.to_json(pdf, header=False, footer=False)
@@ -156,19 +102,17 @@ def listScheme(of: list[Any]) -> list[schemeParts]:
     res.append(len(of)) # type: ignore
     return res
 
-class DBProductData(pyd.BaseModel):
-    id: str
-    text: str
-    metadata: dict[str, str | bool | float]
-
 if __name__ == "__main__":
     import os
     import json
     import process as src
+    import ingest
+    import documents
 
     dir = os.path.dirname(os.path.abspath(__file__))
     chroma = cdb.PersistentClient()
-    products = chroma.get_or_create_collection("products", embedding_function=OllamaEmbedder())
+    products = openCollection(chroma, "products", OllamaEmbedder())
+    textIndex = openTextIndex(products)
 
     while True:
         print("\n")
@@ -184,7 +128,12 @@ if __name__ == "__main__":
 6. Upsert entries from file
 7. Add entries from PDF file
 8. Add entries from image file
-9. Quit
+9. Stream entries from large JSON or JSONL file
+10. Build flat vector index
+11. Add entries from a directory or glob of PDF and image files
+12. Export snapshot
+13. Import snapshot (replaces the database)
+14. Quit
 Input option number >>> """)
             try:
                 opt = int(option.strip())
@@ -204,7 +153,7 @@ Input option number >>> """)
                     entriesList.append(ProductData.model_validate(d).toDB())
                 except pyd.ValidationError as e:
                     print(f"Validation error: {e}")
-            products.add([pd.id for pd in entriesList], metadatas=[pd.metadata for pd in entriesList], documents=[pd.text for pd in entriesList])
+            writeEntries(products, textIndex, entriesList, upsert=False)
             print("Finished!")
 
         elif opt == 2:
@@ -260,9 +209,11 @@ Input option number >>> """)
 
         elif opt == 3:
             print("Clearing")
-            chroma.delete_collection("products")
-            chroma.create_collection("products", embedding_function=OllamaEmbedder())
-            products = chroma.get_collection("products", embedding_function=OllamaEmbedder())
+            deleteCollection(chroma, "products")
+            products = openCollection(chroma, "products", OllamaEmbedder())
+            textIndex.clear()
+            textIndex.save(settings.textIndexPath)
+            catalogVersion.bump()
             print("Finished!")
 
         elif opt == 4:
@@ -275,6 +226,7 @@ Input option number >>> """)
 
         elif opt == 6:
             fileName = input("Enter file name >>> ")
+            prune = input("Delete entries missing from the file? (y/n) >>> ").strip().lower() == "y"
             print("Loading...")
             entriesList: list[DBProductData] = []
             with open(dir + fileName) as file:
@@ -284,8 +236,8 @@ Input option number >>> """)
                     entriesList.append(ProductData.model_validate(d).toDB())
                 except pyd.ValidationError as e:
                     print(f"Validation error: {e}")
-            products.upsert([pd.id for pd in entriesList], metadatas=[pd.metadata for pd in entriesList], documents=[pd.text for pd in entriesList])
-            print("Finished!")
+            summary = ingest.syncEntries(products, textIndex, entriesList, prune)
+            print(f"Finished! {summary}")
 
         elif opt == 7:
             GETFILE_TYPE: Literal["unst"] | Literal["mu"] = "unst"
@@ -301,5 +253,45 @@ Input option number >>> """)
             pass
 
         elif opt == 9:
+            fileName = input("Enter file name >>> ")
+            upsert = input("Update existing entries? (y/n) >>> ").strip().lower() == "y"
+            prune = upsert and input("Delete entries missing from the file? (y/n) >>> ").strip().lower() == "y"
+            print("Loading...")
+            summary = ingest.streamIngest(products, textIndex, dir + fileName, upsert, prune)
+            print(f"Finished! {summary}")
+
+        elif opt == 10:
+            print(f"Building {settings.flatStore.dtype} flat vector index...")
+            version = catalogVersion.read()
+            count = FlatStore.build(settings.flatStore.path, products, settings.flatStore.dtype, {"model": settings.embeddingModel, "catalogVersion": version})
+            # the server only searches the index while its version is current, so a write during the build leaves it on chroma until the next build
+            if catalogVersion.read() == version:
+                FlatStore.stamp(settings.flatStore.path, {"catalogVersion": catalogVersion.bump()})
+            print(f"Finished! {count} vectors written to {settings.flatStore.path}.")
+
+        elif opt == 11:
+            pattern = input("Enter directory or glob >>> ")
+            print("Loading...")
+            summary = documents.ingestDocuments(products, textIndex, pattern)
+            print(f"Finished! {summary}")
+
+        elif opt == 12:
+            path = input("Enter snapshot directory >>> ")
+            print("Exporting...")
+            count = exportSnapshot(path, products)
+            print(f"Finished! {count} products written to {path}.")
+
+        elif opt == 13:
+            path = input("Enter snapshot directory >>> ")
+            snapshot = loadSnapshot(path)
+            if snapshot is not None:
+                print("Replacing the database...")
+                deleteCollection(chroma, "products")
+                products = openCollection(chroma, "products", OllamaEmbedder())
+                textIndex.clear()
+                count = restoreSnapshot(snapshot, products, textIndex)
+                print(f"Finished! {count} products restored.")
+
+        elif opt == 14:
             print("Quitting...")
             break
\ No newline at end of file
@@ -0,0 +1,185 @@
+import io
+import os
+import glob
+import time
+import hashlib
+import chromadb as cdb
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Iterator, TYPE_CHECKING
+try:
+    from src.config import settings
+    from src.models import DataPart, DBProductData, ProductData
+    from src.ingest import SyncSummary, validate, writeChunk
+    from src.store import catalogVersion
+    from src.textindex import TextIndex
+except ModuleNotFoundError:
+    from config import settings
+    from models import DataPart, DBProductData, ProductData
+    from ingest import SyncSummary, validate, writeChunk
+    from store import catalogVersion
+    from textindex import TextIndex
+if TYPE_CHECKING:
+    import unstructured.documents.elements as unstels
+
+PDF_EXTENSIONS = {".pdf"}
+IMAGE_EXTENSIONS = {".png", ".heic", ".jpg", ".jpeg"}
+
+def extractProductDataUnst(elements: "list[unstels.Element]") -> list[ProductData]:
+    import unstructured.documents.elements as unstels
+    prices: list[float] = []
+    last: unstels.Element = elements[0]
+    parts: list[DataPart] = []
+    part = DataPart()
+    titleEncountered: bool = False
+    for el in elements:
+        eltype = type(el)
+        if el.text == last.text and type(last) == unstels.Title and eltype == unstels.Text:
+            continue
+        match eltype:
+            case unstels.Title:
+                part.name = el.text
+                titleEncountered = True
+            case unstels.Text | unstels.ListItem | unstels.NarrativeText:
+                if not titleEncountered:
+                    continue
+                try:
+                    prices.append(int(el.text))
+                except ValueError:
+                    if part.desc == None:
+                        part.desc = ""
+                    part.desc += " " + el.text
+            case _:
+                print(f"Unknown element type: {eltype}, containing \"{el.text}\"")
+        last = el
+        if part.name != None and part.desc != None:
+            parts.append(part)
+            part = DataPart()
+    priceNum = len(prices)
+    for ind, part in enumerate(parts):
+        part.price = prices[ind] if ind < priceNum else 0
+    return [dp.toData() for dp in parts]
+
+def findDocuments(pattern: str) -> Iterator[str]:
+    paths = glob.iglob(os.path.join(pattern, "**", "*"), recursive=True) if os.path.isdir(pattern) else glob.iglob(pattern, recursive=True)
+    for path in paths:
+        if os.path.splitext(path)[1].lower() in PDF_EXTENSIONS | IMAGE_EXTENSIONS and os.path.isfile(path):
+            yield path
+
+def pages(path: str) -> list[int | None]:
+    # PDFs are split into pages when pymupdf is available, otherwise parsed whole; None means the whole file
+    if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS:
+        return [None]
+    try:
+        import pymupdf as pymu
+    except ModuleNotFoundError:
+        return [None]
+    with pymu.open(path) as pdf:
+        return list(range(pdf.page_count))
+
+def documentSku(product: ProductData) -> str:
+    # parsed catalogs rarely print SKUs, so derive a stable one from the product's text
+    return "DOC" + hashlib.sha1(f"{product.name}\0{product.desc}".encode()).hexdigest()[:12].upper()
+
+def parsePage(path: str, page: int | None) -> list[dict]:
+    # runs in a worker process, so only plain data goes back
+    if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS:
+        import unstructured.partition.image as unstimg
+        elements = unstimg.partition_image(filename=path, strategy="hi_res", languages=["eng"], extract_image_block_types=["Image", "Table"])
+    else:
+        import unstructured.partition.pdf as unstpdf
+        if page is None:
+            elements = unstpdf.partition_pdf(filename=path, strategy="auto", languages=["eng"], extract_image_block_types=["Image", "Table"])
+        else:
+            import pymupdf as pymu
+            with pymu.open(path) as pdf, pymu.open() as single:
+                single.insert_pdf(pdf, from_page=page, to_page=page)
+                data = single.tobytes()
+            elements = unstpdf.partition_pdf(file=io.BytesIO(data), strategy="auto", languages=["eng"], extract_image_block_types=["Image", "Table"])
+    if len(elements) == 0:
+        return []
+    products = extractProductDataUnst(elements)
+    return [product.model_dump() | {"sku": product.sku or documentSku(product)} for product in products]
+
+def ingestDocuments(collection: cdb.Collection, index: TextIndex, pattern: str) -> SyncSummary:
+    summary = SyncSummary()
+    failures: list[str] = []
+    seen: set[str] = set()
+    chunk: list[DBProductData] = []
+    inFlight: deque[tuple[str, int | None, Future[list[dict]]]] = deque()
+    files = parsed = 0
+    start = time.monotonic()
+
+    def write() -> None:
+        nonlocal chunk
+        written, chunkSummary = writeChunk(collection, chunk, upsert=True, index=index)
+        for pd in written:
+            index.put(pd.id, pd.metadata)
+        summary.merge(chunkSummary)
+        # saved before the bump, so nobody reads the new version from an index without the chunk
+        index.save(settings.textIndexPath)
+        catalogVersion.bump()
+        chunk = []
+
+    def collect() -> None:
+        # pages are collected oldest first while the pool keeps parsing the ones behind them
+        nonlocal parsed
+        path, page, future = inFlight.popleft()
+        where = path if page is None else f"{path} page {page + 1}"
+        try:
+            records = future.result()
+        except Exception as e:
+            failures.append(where)
+            print(f"Failed to parse {where}: {e}")
+            return
+        for record in records:
+            pd = validate(record)
+            # the same product printed twice in a catalog is only written once
+            if pd is not None and pd.id not in seen:
+                seen.add(pd.id)
+                chunk.append(pd)
+                if len(chunk) >= settings.ingest.chunkSize:
+                    write()
+        parsed += 1
+        print(f"{parsed} pages parsed from {files} files, {len(seen)} products, {parsed / (time.monotonic() - start):.1f} pages/s")
+
+    with ProcessPoolExecutor(max_workers=settings.documents.workers) as executor:
+        for path in findDocuments(pattern):
+            files += 1
+            try:
+                documentPages = pages(path)
+            except Exception as e:
+                failures.append(path)
+                print(f"Failed to open {path}: {e}")
+                continue
+            for page in documentPages:
+                inFlight.append((path, page, executor.submit(parsePage, path, page)))
+                if len(inFlight) >= settings.documents.pagesInFlight:
+                    collect()
+        while len(inFlight) > 0:
+            collect()
+    if len(chunk) > 0:
+        write()
+    index.save(settings.textIndexPath)
+    catalogVersion.bump()
+    if len(failures) > 0:
+        print(f"{len(failures)} pages or files failed: {", ".join(failures)}")
+    return summary
+
+if __name__ == "__main__":
+    import argparse
+    try:
+        from src.embedding import OllamaEmbedder
+        from src.shards import openCollection
+        from src.store import openTextIndex
+    except ModuleNotFoundError:
+        from embedding import OllamaEmbedder
+        from shards import openCollection
+        from store import openTextIndex
+
+    parser = argparse.ArgumentParser(description="Parse PDF and image catalogs and upsert the products found in them.")
+    parser.add_argument("pattern", help="a directory, file or glob of PDFs and images")
+    args = parser.parse_args()
+    products = openCollection(cdb.PersistentClient(), "products", OllamaEmbedder())
+    summary = ingestDocuments(products, openTextIndex(products), args.pattern)
+    print(f"Finished! {summary}")
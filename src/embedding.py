@@ -0,0 +1,170 @@
+import time
+import sqlite3
+import threading
+import numpy as np
+import ollama as ollm
+import chromadb as cdb
+from concurrent.futures import Future
+from typing import Any, Callable, Sequence
+try:
+    from src import metrics
+    from src.cache import LRUCache
+    from src.config import EmbedBatchSettings, EmbedCacheSettings, settings
+except ModuleNotFoundError:
+    import metrics
+    from cache import LRUCache
+    from config import EmbedBatchSettings, EmbedCacheSettings, settings
+
+def ollamaBackend(texts: list[str]) -> Sequence[Sequence[float]]:
+    return ollm.embed(settings.embeddingModel, texts).embeddings
+
+# everything that embeds goes through here, so benchmarks can swap Ollama for a local embedder
+backend: Callable[[list[str]], Sequence[Sequence[float]]] = ollamaBackend
+def useBackend(embedder: Callable[[list[str]], Sequence[Sequence[float]]]) -> None:
+    global backend
+    backend = embedder
+
+def normaliseText(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+class DiskTier:
+    def __init__(self, path: str, ttlSeconds: float) -> None:
+        self.ttlSeconds = ttlSeconds
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, created REAL NOT NULL)")
+        self.connection.execute("DELETE FROM embeddings WHERE created < ?", (time.time() - ttlSeconds,))
+        self.connection.commit()
+
+    def get(self, key: str) -> np.ndarray | None:
+        with self.lock:
+            row = self.connection.execute("SELECT vector, created FROM embeddings WHERE key = ?", (key,)).fetchone()
+        if row is None or time.time() - row[1] > self.ttlSeconds:
+            return None
+        return np.frombuffer(row[0], dtype=np.float32)
+
+    def put(self, key: str, vector: np.ndarray) -> None:
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", (key, vector.astype(np.float32).tobytes(), time.time()))
+            self.connection.commit()
+
+class EmbeddingCache:
+    def __init__(self, cacheSettings: EmbedCacheSettings) -> None:
+        # keys are (model, normalised text), so switching models never serves stale vectors
+        self.memory = LRUCache[tuple[str, str], np.ndarray](cacheSettings.maxBytes, cacheSettings.ttlSeconds, lambda k, v: v.nbytes + len(k[0]) + len(k[1]))
+        self.disk = DiskTier(cacheSettings.diskPath, cacheSettings.ttlSeconds) if cacheSettings.diskPath is not None else None
+        self.diskHits = 0
+
+    def get(self, model: str, text: str) -> np.ndarray | None:
+        vector = self.memory.get((model, text))
+        if vector is None and self.disk is not None:
+            vector = self.disk.get(model + "\0" + text)
+            if vector is not None:
+                self.diskHits += 1
+                self.memory.put((model, text), vector)
+        return vector
+
+    def put(self, model: str, text: str, vector: np.ndarray) -> None:
+        vector.setflags(write=False)
+        self.memory.put((model, text), vector)
+        if self.disk is not None:
+            self.disk.put(model + "\0" + text, vector)
+
+    def stats(self) -> dict[str, int]:
+        return self.memory.stats() | {"diskHits": self.diskHits}
+
+class EmbedBatcher:
+    def __init__(self, batchSettings: EmbedBatchSettings) -> None:
+        self.maxWait = batchSettings.maxWaitMs / 1000
+        self.maxBatchSize = batchSettings.maxBatchSize
+        # identical texts from concurrent requests share one slot in the batch
+        self.pending: dict[str, list[Future[np.ndarray]]] = {}
+        self.condition = threading.Condition()
+        self.batches = 0
+        self.items = 0
+        self.requests = 0
+        for i in range(batchSettings.concurrency):
+            threading.Thread(target=self.run, name=f"embed-batcher-{i}", daemon=True).start()
+
+    def submit(self, texts: Sequence[str]) -> list[Future[np.ndarray]]:
+        futures: list[Future[np.ndarray]] = []
+        with self.condition:
+            for text in texts:
+                future: Future[np.ndarray] = Future()
+                self.pending.setdefault(text, []).append(future)
+                futures.append(future)
+            self.requests += len(texts)
+            self.condition.notify_all()
+        return futures
+
+    def take(self) -> dict[str, list[Future[np.ndarray]]]:
+        with self.condition:
+            # another batcher thread may have taken everything while this one waited
+            while len(self.pending) == 0:
+                while len(self.pending) == 0:
+                    self.condition.wait()
+                # wait briefly for more texts to arrive, unless the batch is already full
+                deadline = time.monotonic() + self.maxWait
+                while len(self.pending) < self.maxBatchSize and (remaining := deadline - time.monotonic()) > 0:
+                    self.condition.wait(remaining)
+            batch = dict(list(self.pending.items())[:self.maxBatchSize])
+            for text in batch:
+                del self.pending[text]
+            self.batches += 1
+            self.items += len(batch)
+            return batch
+
+    def run(self) -> None:
+        while True:
+            batch = self.take()
+            try:
+                vectors = backend(list(batch))
+                # callers past the end of a short answer would otherwise wait forever
+                if len(vectors) != len(batch):
+                    raise ValueError(f"The embedding backend returned {len(vectors)} vectors for {len(batch)} texts.")
+            except Exception as e:
+                for futures in batch.values():
+                    for future in futures:
+                        future.set_exception(e)
+                continue
+            for futures, vector in zip(batch.values(), vectors):
+                result = np.array(vector, dtype=np.float32)
+                for future in futures:
+                    future.set_result(result)
+
+    def stats(self) -> dict[str, int]:
+        with self.condition:
+            return {"requests": self.requests, "items": self.items, "batches": self.batches, "pending": len(self.pending)}
+
+queryCache = EmbeddingCache(settings.embedCache) if settings.embedCache.enabled else None
+batcher = EmbedBatcher(settings.embedBatching) if settings.embedBatching.enabled else None
+
+def embedRaw(texts: Sequence[str]) -> list[np.ndarray]:
+    # bulk loads are already batched, so only small calls go through the batcher
+    metrics.count("embedCalls")
+    with metrics.timed("embedBackend"):
+        if batcher is not None and len(texts) < batcher.maxBatchSize:
+            return [future.result() for future in batcher.submit(texts)]
+        return [np.array(v, dtype=np.float32) for v in backend(list(texts))]
+
+def embedMany(texts: Sequence[str]) -> list[np.ndarray]:
+    model = settings.embeddingModel
+    if queryCache is None:
+        return embedRaw(texts)
+    keys = [normaliseText(t) for t in texts]
+    found = {k: queryCache.get(model, k) for k in dict.fromkeys(keys)}
+    missing = [k for k, v in found.items() if v is None]
+    if len(missing) > 0:
+        for key, vector in zip(missing, embedRaw(missing)):
+            found[key] = vector
+            queryCache.put(model, key, vector)
+    return [found[k] for k in keys] # type: ignore
+
+class OllamaEmbedder(cdb.EmbeddingFunction):
+    def __init__(self, *args: Any, useCache: bool = False, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.useCache = useCache
+
+    def __call__(self, docs: cdb.Documents) -> cdb.Embeddings:
+        return embedMany(docs) if self.useCache else embedRaw(docs)
@@ -0,0 +1,192 @@
+import os
+import json
+import shutil
+import numpy as np
+import chromadb as cdb
+from typing import Any, Callable, Iterable, Literal, Mapping, Sequence
+try:
+    from src.models import TAG_PREFIX, tagKey
+except ModuleNotFoundError:
+    from models import TAG_PREFIX, tagKey
+
+type VectorType = Literal["float32", "float16", "int8"]
+
+# rows scored per matrix product, so a query never converts the whole matrix at once
+BLOCK_ROWS = 16384
+PAGE_SIZE = 1000
+
+# the where clause operators SearchFilters produces, over (present, values) columns
+operators: dict[str, Callable[[np.ndarray, np.ndarray, Any], np.ndarray]] = {
+    "$eq": lambda present, values, value: present & (values == value),
+    "$ne": lambda present, values, value: ~present | (values != value),
+    "$gt": lambda present, values, value: present & (values > value),
+    "$gte": lambda present, values, value: present & (values >= value),
+    "$lt": lambda present, values, value: present & (values < value),
+    "$lte": lambda present, values, value: present & (values <= value),
+}
+
+class FlatStore:
+    # exact nearest neighbours over a memory-mapped matrix, answering the same query()/get() calls as a chroma collection
+    def __init__(self, path: str) -> None:
+        with open(os.path.join(path, "manifest.json")) as file:
+            self.manifest: dict[str, Any] = json.load(file)
+        # read-only mappings, so every worker process shares the same page cache
+        self.vectors: np.ndarray = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.norms: np.ndarray = np.load(os.path.join(path, "norms.npy"), mmap_mode="r")
+        self.scales: np.ndarray | None = np.load(os.path.join(path, "scales.npy"), mmap_mode="r") if self.manifest["dtype"] == "int8" else None
+        with open(os.path.join(path, "metadata.json")) as file:
+            columnar: dict[str, Any] = json.load(file)
+        self.ids: list[str] = columnar["ids"]
+        self.columns: dict[str, list[Any]] = columnar["columns"]
+        self.rows = {id: row for row, id in enumerate(self.ids)}
+        self.filterColumns: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def metadata(self, row: int) -> dict[str, Any]:
+        return {key: column[row] for key, column in self.columns.items() if column[row] is not None}
+
+    def column(self, key: str) -> tuple[np.ndarray, np.ndarray]:
+        if key not in self.filterColumns:
+            if key.startswith(TAG_PREFIX):
+                # tag flags aren't stored as columns, they come from the tags column
+                present = np.array([key in {tagKey(t) for t in str(tags or "").split(";")} for tags in self.columns.get("tags", [None] * len(self))], dtype=bool)
+                self.filterColumns[key] = (present, present)
+            else:
+                column = self.columns.get(key, [None] * len(self))
+                present = np.array([value is not None for value in column], dtype=bool)
+                self.filterColumns[key] = (present, np.array([value if value is not None else 0 for value in column]))
+        return self.filterColumns[key]
+
+    def mask(self, where: Mapping[str, Any]) -> np.ndarray:
+        if "$and" in where:
+            return np.logical_and.reduce([self.mask(clause) for clause in where["$and"]])
+        if "$or" in where:
+            return np.logical_or.reduce([self.mask(clause) for clause in where["$or"]])
+        (key, condition), = where.items()
+        operator, value = next(iter(condition.items())) if isinstance(condition, Mapping) else ("$eq", condition)
+        present, values = self.column(key)
+        return operators[operator](present, values, value) if len(self) > 0 else present
+
+    def block(self, rows: slice | np.ndarray) -> np.ndarray:
+        block = self.vectors[rows].astype(np.float32)
+        if self.scales is not None:
+            block *= self.scales[rows, None]
+        return block
+
+    def distances(self, queries: np.ndarray, rows: slice | np.ndarray) -> np.ndarray:
+        # squared L2, like chroma's default space: |x|^2 - 2x.q + |q|^2
+        return self.norms[rows, None] - 2 * (self.block(rows) @ queries.T) + (queries * queries).sum(axis=1)
+
+    def query(self, query_embeddings: Sequence[Sequence[float]] | np.ndarray, n_results: int = 10, where: Mapping[str, Any] | None = None, **_: Any) -> dict[str, list[list[Any]]]:
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        # filtered out rows are never scored
+        allowed = None if where is None else np.flatnonzero(self.mask(where))
+        total = len(self) if allowed is None else len(allowed)
+        k = min(n_results, total)
+        bestRows = np.empty((len(queries), 0), dtype=np.int64)
+        bestDistances = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, total, BLOCK_ROWS):
+            stop = min(start + BLOCK_ROWS, total)
+            blockRows = np.arange(start, stop) if allowed is None else allowed[start:stop]
+            # keep the running top-k of every query alongside this block's scores
+            distances = np.concatenate([bestDistances, self.distances(queries, slice(start, stop) if allowed is None else blockRows).T], axis=1)
+            rows = np.concatenate([bestRows, np.broadcast_to(blockRows, (len(queries), stop - start))], axis=1)
+            if distances.shape[1] > k:
+                keep = np.argpartition(distances, k - 1, axis=1)[:, :k]
+                distances = np.take_along_axis(distances, keep, axis=1)
+                rows = np.take_along_axis(rows, keep, axis=1)
+            bestDistances, bestRows = distances, rows
+        order = np.argsort(bestDistances, axis=1, kind="stable")
+        bestDistances = np.take_along_axis(bestDistances, order, axis=1)
+        bestRows = np.take_along_axis(bestRows, order, axis=1)
+        return {
+            "ids": [[self.ids[row] for row in rows] for rows in bestRows.tolist()],
+            "metadatas": [[self.metadata(row) for row in rows] for rows in bestRows.tolist()],
+            "distances": bestDistances.tolist(),
+        }
+
+    def get(self, ids: Iterable[str], include: Sequence[str] = ("metadatas",), **_: Any) -> dict[str, Any]:
+        rows = [self.rows[id] for id in ids if id in self.rows]
+        stored: dict[str, Any] = {"ids": [self.ids[row] for row in rows]}
+        if "embeddings" in include:
+            stored["embeddings"] = self.block(np.array(rows, dtype=np.int64))
+        if "metadatas" in include:
+            stored["metadatas"] = [self.metadata(row) for row in rows]
+        return stored
+
+    @staticmethod
+    def write(path: str, ids: list[str], vectors: np.ndarray, metadatas: list[Mapping[str, Any]], dtype: VectorType, manifest: Mapping[str, Any] = {}, documents: list[str] | None = None) -> None:
+        # written beside the live store and swapped in, so readers never see a half-built one
+        building = path + ".tmp"
+        shutil.rmtree(building, ignore_errors=True)
+        os.makedirs(building)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        np.save(os.path.join(building, "norms.npy"), (vectors * vectors).sum(axis=1))
+        if dtype == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1
+            np.save(os.path.join(building, "scales.npy"), scales.astype(np.float32))
+            np.save(os.path.join(building, "vectors.npy"), np.round(vectors / scales[:, None]).astype(np.int8))
+        else:
+            np.save(os.path.join(building, "vectors.npy"), vectors.astype(dtype))
+        # tag flags are left out, filters rebuild them from the tags column
+        keys = sorted({key for meta in metadatas for key in meta if not key.startswith(TAG_PREFIX)})
+        with open(os.path.join(building, "metadata.json"), "w") as file:
+            json.dump({"ids": ids, "columns": {key: [meta.get(key) for meta in metadatas] for key in keys}}, file)
+        if documents is not None:
+            with open(os.path.join(building, "documents.json"), "w") as file:
+                json.dump(documents, file)
+        # the manifest goes last, it is what readers watch
+        with open(os.path.join(building, "manifest.json"), "w") as file:
+            json.dump({**manifest, "dtype": dtype, "count": len(ids), "dimensions": vectors.shape[1]}, file)
+        if os.path.isdir(path):
+            shutil.rmtree(path + ".old", ignore_errors=True)
+            os.replace(path, path + ".old")
+        os.replace(building, path)
+        shutil.rmtree(path + ".old", ignore_errors=True)
+
+    @staticmethod
+    def stamp(path: str, values: Mapping[str, Any]) -> None:
+        with open(os.path.join(path, "manifest.json")) as file:
+            manifest = json.load(file)
+        with open(os.path.join(path, "manifest.json.tmp"), "w") as file:
+            json.dump(manifest | dict(values), file)
+        os.replace(os.path.join(path, "manifest.json.tmp"), os.path.join(path, "manifest.json"))
+
+    @classmethod
+    def build(cls, path: str, collection: cdb.Collection, dtype: VectorType, manifest: Mapping[str, Any] = {}, documents: bool = False) -> int:
+        ids: list[str] = []
+        vectors: list[np.ndarray] = []
+        metadatas: list[Mapping[str, Any]] = []
+        texts: list[str] = []
+        offset = 0
+        while True:
+            page = collection.get(include=["embeddings", "metadatas", "documents"] if documents else ["embeddings", "metadatas"], limit=PAGE_SIZE, offset=offset)
+            if len(page["ids"]) == 0 or page["embeddings"] is None or page["metadatas"] is None:
+                break
+            ids.extend(page["ids"])
+            vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+            metadatas.extend(page["metadatas"])
+            texts.extend(page["documents"] or [])
+            offset += len(page["ids"])
+        cls.write(path, ids, np.concatenate(vectors) if len(vectors) > 0 else np.empty((0, 0), dtype=np.float32), metadatas, dtype, manifest, texts if documents else None)
+        return len(ids)
+
+class FlatStoreFile:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.mtime: int | None = None
+        self.store: FlatStore | None = None
+
+    def current(self) -> FlatStore | None:
+        # a rebuild swaps the directory, so reload when its manifest changes
+        try:
+            mtime = os.stat(os.path.join(self.path, "manifest.json")).st_mtime_ns
+        except FileNotFoundError:
+            return self.store
+        if mtime != self.mtime:
+            self.store = FlatStore(self.path)
+            self.mtime = mtime
+        return self.store
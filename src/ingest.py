@@ -0,0 +1,218 @@
+import os
+import json
+import time
+import pydantic as pyd
+import chromadb as cdb
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import IO, Any, Callable, Iterator, Mapping
+try:
+    from src.config import settings
+    from src.models import DBProductData, ProductData, clearStaleTags
+    from src.store import catalogVersion
+    from src.embedding import embedRaw
+    from src.textindex import TextIndex
+except ModuleNotFoundError:
+    from config import settings
+    from models import DBProductData, ProductData, clearStaleTags
+    from store import catalogVersion
+    from embedding import embedRaw
+    from textindex import TextIndex
+
+def iterJsonArray(file: IO[str], bufferSize: int = 1 << 16) -> Iterator[Any]:
+    decoder = json.JSONDecoder()
+    buffer = file.read(bufferSize).lstrip()
+    if not buffer.startswith("["):
+        raise ValueError("Expected a JSON array.")
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip()
+        if buffer.startswith(","):
+            buffer = buffer[1:].lstrip()
+        if buffer.startswith("]"):
+            return
+        try:
+            value, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            # the next value may just be cut off by the end of the buffer
+            more = file.read(bufferSize)
+            if more == "":
+                raise
+            buffer += more
+            continue
+        yield value
+        buffer = buffer[end:]
+        if len(buffer) < bufferSize:
+            buffer += file.read(bufferSize)
+
+def iterRecords(path: str) -> Iterator[Any]:
+    with open(path) as file:
+        if path.endswith(".jsonl"):
+            for line in file:
+                if line.strip() != "":
+                    yield json.loads(line)
+        else:
+            yield from iterJsonArray(file)
+
+def validate(record: Any) -> DBProductData | None:
+    try:
+        return ProductData.model_validate(record).toDB()
+    except pyd.ValidationError as e:
+        print(f"Validation error: {e}")
+        return None
+
+class SyncSummary(pyd.BaseModel):
+    added: int = 0
+    reembedded: int = 0
+    metadataOnly: int = 0
+    unchanged: int = 0
+    deleted: int = 0
+
+    def merge(self, other: "SyncSummary") -> None:
+        for field in SyncSummary.model_fields:
+            setattr(self, field, getattr(self, field) + getattr(other, field))
+
+    def __str__(self) -> str:
+        return f"{self.added} added, {self.reembedded} re-embedded, {self.metadataOnly} metadata only, {self.unchanged} unchanged, {self.deleted} deleted"
+
+def withRetries[T](function: Callable[[], T]) -> T:
+    for attempt in range(settings.ingest.retries):
+        try:
+            return function()
+        except Exception as e:
+            print(f"Chunk failed ({e}), retrying...")
+            time.sleep(2 ** attempt)
+    return function()
+
+def embedAndWrite(write: Callable[..., None], chunk: list[DBProductData], stored: Mapping[str, Mapping[str, Any]] = {}) -> None:
+    if len(chunk) > 0:
+        write([pd.id for pd in chunk], embeddings=embedRaw([pd.text for pd in chunk]), metadatas=[clearStaleTags(stored.get(pd.id, {}), pd.metadata) for pd in chunk], documents=[pd.text for pd in chunk])
+
+def syncChunk(collection: cdb.Collection, chunk: list[DBProductData], index: TextIndex | None = None) -> tuple[list[DBProductData], SyncSummary]:
+    existing = collection.get(ids=[pd.id for pd in chunk], include=["metadatas"])
+    stored = dict(zip(existing["ids"], existing["metadatas"] or []))
+    fresh = [pd for pd in chunk if pd.id not in stored]
+    changed = [pd for pd in chunk if pd.id in stored and stored[pd.id].get("textHash") != pd.metadata["textHash"]]
+    # only fields outside text() changed, such as price or availability, so the stored embedding still holds
+    metadataOnly = [pd for pd in chunk if pd.id in stored and stored[pd.id].get("textHash") == pd.metadata["textHash"] and stored[pd.id] != pd.metadata]
+    embedAndWrite(collection.upsert, fresh + changed, stored)
+    if len(metadataOnly) > 0:
+        collection.update([pd.id for pd in metadataOnly], metadatas=[clearStaleTags(stored[pd.id], pd.metadata) for pd in metadataOnly]) # type: ignore
+    summary = SyncSummary(added=len(fresh), reembedded=len(changed), metadataOnly=len(metadataOnly), unchanged=len(chunk) - len(fresh) - len(changed) - len(metadataOnly))
+    # unchanged in chroma but missing from the index, such as rows written after the last checkpoint of an interrupted import
+    unindexed = [pd for pd in chunk if index is not None and pd.id in stored and stored[pd.id] == pd.metadata and pd.id not in index]
+    return fresh + changed + metadataOnly + unindexed, summary
+
+def addChunk(collection: cdb.Collection, chunk: list[DBProductData]) -> tuple[list[DBProductData], SyncSummary]:
+    # add() leaves ids chroma already holds untouched, such as those a resumed import sends again, so they are neither embedded nor counted
+    stored = set(collection.get(ids=[pd.id for pd in chunk], include=[])["ids"])
+    fresh = [pd for pd in chunk if pd.id not in stored]
+    embedAndWrite(collection.add, fresh)
+    return chunk, SyncSummary(added=len(fresh), unchanged=len(chunk) - len(fresh))
+
+def writeChunk(collection: cdb.Collection, chunk: list[DBProductData], upsert: bool, index: TextIndex | None = None) -> tuple[list[DBProductData], SyncSummary]:
+    if upsert:
+        return withRetries(lambda: syncChunk(collection, chunk, index))
+    return withRetries(lambda: addChunk(collection, chunk))
+
+def pruneMissing(collection: cdb.Collection, index: TextIndex, seen: set[str]) -> int:
+    missing: list[str] = []
+    offset = 0
+    while len(page := collection.get(include=[], limit=1000, offset=offset)["ids"]) > 0:
+        missing.extend(id for id in page if id not in seen)
+        offset += len(page)
+    for start in range(0, len(missing), 1000):
+        collection.delete(missing[start:start + 1000])
+    for id in missing:
+        index.remove(id)
+    return len(missing)
+
+def syncEntries(collection: cdb.Collection, index: TextIndex, entries: list[DBProductData], prune: bool) -> SyncSummary:
+    summary = SyncSummary()
+    for start in range(0, len(entries), settings.ingest.chunkSize):
+        written, chunkSummary = writeChunk(collection, entries[start:start + settings.ingest.chunkSize], upsert=True, index=index)
+        for pd in written:
+            index.put(pd.id, pd.metadata)
+        summary.merge(chunkSummary)
+    if prune:
+        summary.deleted = pruneMissing(collection, index, {pd.id for pd in entries})
+    index.save(settings.textIndexPath)
+    catalogVersion.bump()
+    return summary
+
+class Checkpoint:
+    def __init__(self, source: str) -> None:
+        self.path = source + ".checkpoint"
+        self.done = 0
+        if os.path.isfile(self.path):
+            with open(self.path) as file:
+                self.done = json.load(file)["done"]
+
+    def save(self, done: int) -> None:
+        self.done = done
+        with open(self.path + ".tmp", "w") as file:
+            json.dump({"done": done}, file)
+        os.replace(self.path + ".tmp", self.path)
+
+    def finish(self) -> None:
+        if os.path.isfile(self.path):
+            os.remove(self.path)
+
+def streamIngest(collection: cdb.Collection, index: TextIndex, source: str, upsert: bool, prune: bool = False) -> SyncSummary:
+    checkpoint = Checkpoint(source)
+    if checkpoint.done > 0:
+        print(f"Resuming after {checkpoint.done} records.")
+    inFlight: deque[tuple[int, Future[tuple[list[DBProductData], SyncSummary]]]] = deque()
+    done = checkpoint.done
+    summary = SyncSummary()
+    seen: set[str] = set()
+    chunksSinceSave = 0
+    start = time.monotonic()
+
+    def collect() -> None:
+        # chunks are collected oldest first, so every record before `done` has been written
+        nonlocal done, chunksSinceSave
+        end, future = inFlight.popleft()
+        written, chunkSummary = future.result()
+        for pd in written:
+            if upsert or pd.id not in index:
+                index.put(pd.id, pd.metadata)
+        summary.merge(chunkSummary)
+        catalogVersion.bump()
+        done = end
+        chunksSinceSave += 1
+        if chunksSinceSave >= settings.ingest.checkpointEvery:
+            index.save(settings.textIndexPath)
+            checkpoint.save(done)
+            chunksSinceSave = 0
+        rows = summary.added + summary.reembedded + summary.metadataOnly + summary.unchanged
+        print(f"{done} records read, {rows / (time.monotonic() - start):.0f} rows/s")
+
+    with ThreadPoolExecutor(max_workers=settings.ingest.inFlight) as executor:
+        chunk: list[DBProductData] = []
+        position = checkpoint.done
+        for position, record in enumerate(iterRecords(source), start=1):
+            if position <= checkpoint.done:
+                # already written, but still part of the feed as far as pruning is concerned
+                if isinstance(record, dict) and "sku" in record:
+                    seen.add(str(record["sku"]))
+                continue
+            pd = validate(record)
+            if pd is not None:
+                chunk.append(pd)
+                seen.add(pd.id)
+            if len(chunk) >= settings.ingest.chunkSize:
+                inFlight.append((position, executor.submit(writeChunk, collection, chunk, upsert, index)))
+                chunk = []
+                if len(inFlight) >= settings.ingest.inFlight:
+                    collect()
+        if len(chunk) > 0:
+            inFlight.append((position, executor.submit(writeChunk, collection, chunk, upsert, index)))
+        while len(inFlight) > 0:
+            collect()
+    if prune:
+        summary.deleted = pruneMissing(collection, index, seen)
+    index.save(settings.textIndexPath)
+    catalogVersion.bump()
+    checkpoint.finish()
+    return summary
@@ -0,0 +1,127 @@
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Iterator
+
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...], label: str | None = None) -> None:
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.label = label
+        # label value -> (cumulative bucket counts, sum, count)
+        self.series: dict[str, tuple[list[int], float, int]] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, labelValue: str = "") -> None:
+        with self.lock:
+            counts, total, count = self.series.get(labelValue) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.series[labelValue] = (counts, total + value, count + 1)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for labelValue, (counts, total, count) in sorted(self.series.items()):
+                labels = f'{self.label}="{labelValue}",' if self.label is not None else ""
+                for bound, bucketCount in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{{{labels}le="{bound}"}} {bucketCount}')
+                lines.append(f'{self.name}_bucket{{{labels}le="+Inf"}} {count}')
+                suffix = f"{{{labels.rstrip(",")}}}" if labels != "" else ""
+                lines.append(f"{self.name}_sum{suffix} {total}")
+                lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+class Counter:
+    def __init__(self, name: str, help: str, label: str) -> None:
+        self.name = name
+        self.help = help
+        self.label = label
+        self.values: dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, labelValue: str, amount: int = 1) -> None:
+        with self.lock:
+            self.values[labelValue] = self.values.get(labelValue, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            lines.extend(f'{self.name}{{{self.label}="{labelValue}"}} {value}' for labelValue, value in sorted(self.values.items()))
+        return lines
+
+stageSeconds = Histogram("search_stage_seconds", "Time spent in each search stage.", SECONDS_BUCKETS, "stage")
+candidates = Histogram("search_candidates", "Candidates ranked per search.", COUNT_BUCKETS)
+directHits = Histogram("search_direct_hits", "Direct text matches per search.", COUNT_BUCKETS)
+embedCalls = Histogram("search_embed_calls", "Calls to the embedding backend per search.", COUNT_BUCKETS)
+requests = Counter("search_requests_total", "Searches, by whether the result cache answered them.", "cache")
+routes = Counter("search_routes_total", "Searches, by the route that answered them.", "route")
+registry: list[Histogram | Counter] = [stageSeconds, candidates, directHits, embedCalls, requests, routes]
+
+class Trace:
+    __slots__ = ("stages", "counts")
+
+    def __init__(self) -> None:
+        self.stages: dict[str, float] = {}
+        self.counts: dict[str, int] = {}
+
+    def serverTiming(self) -> str:
+        return ", ".join(f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in self.stages.items())
+
+    def summary(self) -> str:
+        return "; ".join(f"{name}={value}" for name, value in self.counts.items())
+
+    def route(self) -> str | None:
+        return next((name.removeprefix("route.") for name in self.counts if name.startswith("route.")), None)
+
+# the trace of the search running in this context; worker threads are handed a copy of the context
+currentTrace: contextvars.ContextVar[Trace | None] = contextvars.ContextVar("currentTrace", default=None)
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stageSeconds.observe(elapsed, stage)
+        trace = currentTrace.get()
+        if trace is not None:
+            trace.stages[stage] = trace.stages.get(stage, 0.0) + elapsed
+
+def count(name: str, amount: int = 1) -> None:
+    trace = currentTrace.get()
+    if trace is not None:
+        trace.counts[name] = trace.counts.get(name, 0) + amount
+
+def routed(route: str, amount: int = 1) -> None:
+    routes.inc(route, amount)
+    count("route." + route, amount)
+
+@contextmanager
+def request() -> Iterator[Trace]:
+    # nested calls join the trace that is already running
+    trace = currentTrace.get()
+    if trace is not None:
+        yield trace
+        return
+    trace = Trace()
+    token = currentTrace.set(trace)
+    try:
+        with timed("total"):
+            yield trace
+    finally:
+        currentTrace.reset(token)
+        candidates.observe(trace.counts.get("candidates", 0))
+        directHits.observe(trace.counts.get("directHits", 0))
+        embedCalls.observe(trace.counts.get("embedCalls", 0))
+        requests.inc("hit" if trace.counts.get("resultCacheHit", 0) > 0 else "miss")
+
+def render() -> str:
+    return "\n".join(line for metric in registry for line in metric.render()) + "\n"
@@ -0,0 +1,115 @@
+import hashlib
+import pydantic as pyd
+from typing import Literal, Mapping
+
+def decomposeTags(original: Mapping[str, object]):
+    of = dict(original)
+    if "tags" in of and isinstance(of["tags"], str):
+        of["tags"] = of["tags"].split(";")
+    return of
+
+# each tag is also stored as its own flag, so metadata where clauses can filter on it
+TAG_PREFIX = "tag:"
+def tagKey(tag: str) -> str:
+    return TAG_PREFIX + tag.strip().lower()
+
+def clearStaleTags(stored: Mapping[str, object], metadata: Mapping[str, object]) -> dict[str, object]:
+    # chroma merges metadata on upsert and update, so flags of removed tags have to be unset explicitly
+    return {**{key: None for key in stored if key.startswith(TAG_PREFIX) and key not in metadata}, **metadata}
+
+class ProductData(pyd.BaseModel):
+    name: str
+    desc: str
+    sku: str
+    price: float
+    tags: list[str]
+    available: bool = True
+
+    def matches(self, to: str) -> bool:
+        l = to.lower()
+        return l in self.name.lower() or l in self.desc.lower() or l in self.tags
+    
+    def text(self) -> str:
+        return f"NAME: {self.name.lower()}; DESCRIPTION: {self.desc.lower()}; TAGS: {";".join(self.tags).lower()}"
+
+    def toDB(self):
+        dump = self.model_dump()
+        dump["tags"] = ";".join(self.tags)
+        text = self.text()
+        # lets upserts tell whether the embedded text actually changed
+        dump["textHash"] = hashlib.sha1(text.encode()).hexdigest()
+        dump.update({tagKey(tag): True for tag in self.tags if tag.strip() != ""})
+        return DBProductData(id=self.sku, text=text, metadata=dump)
+    
+    def __hash__(self) -> int:
+        return hash(self.model_dump_json())
+    
+class DataPart:
+    def __init__(self, name: str | None = None, desc: str | None = None, sku: str = "", price: float | None = None, tags: list[str] = [], available: bool = True) -> None:
+        self.name = name
+        self.desc = desc
+        self.sku = sku
+        self.price = price
+        self.tags = tags
+        self.available = available
+
+    def toData(self) -> ProductData:
+        if self.name == None or self.desc == None or self.price == None:
+            raise TypeError("Missing fields.")
+        return ProductData(name=self.name, desc=self.desc, sku=self.sku, price=self.price, tags=self.tags, available=self.available)
+
+class SearchFilters(pyd.BaseModel):
+    minPrice: float | None = None
+    maxPrice: float | None = None
+    tags: list[str] = []
+    excludeTags: list[str] = []
+    available: bool | None = None
+
+    def empty(self) -> bool:
+        return self.minPrice is None and self.maxPrice is None and len(self.tags) == 0 and len(self.excludeTags) == 0 and self.available is None
+
+    def key(self) -> tuple:
+        return (self.minPrice, self.maxPrice, tuple(sorted(tagKey(t) for t in self.tags)), tuple(sorted(tagKey(t) for t in self.excludeTags)), self.available)
+
+    def where(self) -> dict[str, object] | None:
+        clauses: list[dict[str, object]] = []
+        if self.minPrice is not None:
+            clauses.append({"price": {"$gte": self.minPrice}})
+        if self.maxPrice is not None:
+            clauses.append({"price": {"$lte": self.maxPrice}})
+        clauses.extend({tagKey(t): True} for t in self.tags)
+        # $ne also matches products that never had the tag
+        clauses.extend({tagKey(t): {"$ne": True}} for t in self.excludeTags)
+        if self.available is not None:
+            clauses.append({"available": self.available})
+        if len(clauses) == 0:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+class BatchSearch(pyd.BaseModel):
+    queries: list[str] = pyd.Field(min_length=1)
+    exactOnly: bool = False
+    limit: int = pyd.Field(10, ge=1, le=100)
+    candidates: int | None = pyd.Field(None, ge=1)
+    filters: SearchFilters = pyd.Field(default_factory=SearchFilters)
+
+class BatchResult(pyd.BaseModel):
+    query: str
+    results: list[ProductData]
+    cursor: str | None = None
+
+class StreamedResult(pyd.BaseModel):
+    # one line of a streamed search: exact matches come first, then the rest of the ranked page, then an error if the search failed part way
+    kind: Literal["exact", "ranked", "error"]
+    product: ProductData | None = None
+    detail: str | None = None
+
+class Suggestion(pyd.BaseModel):
+    text: str
+    kind: str
+    count: int
+
+class DBProductData(pyd.BaseModel):
+    id: str
+    text: str
+    metadata: dict[str, str | bool | float]
@@ -1,69 +1,400 @@
+import re
+import math
+import json
+import base64
+import asyncio
+import threading
+import contextvars
 import numpy as np
-import ollama as ollm
 import chromadb as cdb
 import chromadb.errors as cdberr
 try:
-    from src.database import *
+    from src.models import *
+    from src import metrics
+    from src.cache import LRUCache
+    from src.config import settings
+    from src.embedding import OllamaEmbedder, embedMany, normaliseText
+    from src.flatstore import FlatStore, FlatStoreFile
+    from src.ranking import Candidate, fuse, materialise, pageOf
+    from src.shards import ShardedCollection
+    from src.store import CollectionHandle, catalogVersion, ensureTextIndex
+    from src.textindex import TextIndex, TextIndexFile, tokenise
 except ModuleNotFoundError:
-    from database import *
-from typing import Mapping, TYPE_CHECKING
-if TYPE_CHECKING:
-    from database import *
+    from models import *
+    import metrics
+    from cache import LRUCache
+    from config import settings
+    from embedding import OllamaEmbedder, embedMany, normaliseText
+    from flatstore import FlatStore, FlatStoreFile
+    from ranking import Candidate, fuse, materialise, pageOf
+    from shards import ShardedCollection
+    from store import CollectionHandle, catalogVersion, ensureTextIndex
+    from textindex import TextIndex, TextIndexFile, tokenise
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Literal, Mapping, NamedTuple
 
 chroma = cdb.PersistentClient()
-products = chroma.get_or_create_collection("products", embedding_function=OllamaEmbedder())
+products = CollectionHandle(chroma, "products", OllamaEmbedder(useCache=True))
+ensureTextIndex(products.current())
+textIndexFile = TextIndexFile(settings.textIndexPath, catalogVersion.current)
+# catalog writes are usually picked up in the background, so searches rarely wait on them
+threading.Thread(target=textIndexFile.watch, args=(settings.search.textIndexPollSeconds,), name="textIndex", daemon=True).start()
+flatStoreFile = FlatStoreFile(settings.flatStore.path) if settings.vectorBackend == "flat" else None
 
-def decomposeTags(original: Mapping[str, object]):
-    of = dict(original)
-    if "tags" in of and isinstance(of["tags"], str):
-        of["tags"] = of["tags"].split(";")
-    return of
+def vectorStore() -> cdb.Collection | ShardedCollection | FlatStore:
+    # the flat store is built from the collection by the management CLI, chroma answers until it exists and whenever the catalog changed since
+    if flatStoreFile is not None and (store := flatStoreFile.current()) is not None and store.manifest.get("catalogVersion") == catalogVersion.current():
+        return store
+    return products.current()
+
+def fromStore[T](read: Callable[[cdb.Collection | ShardedCollection | FlatStore], T]) -> T:
+    try:
+        return read(vectorStore())
+    except cdberr.NotFoundError:
+        # replaced between the version check and the read, so ask the replacement
+        return read(products.reopen())
 
 def embed(query: str) -> np.ndarray:
-    vectors = ollm.embed("embeddinggemma", query).embeddings
-    return np.array(vectors[0], dtype=np.float32)
+    with metrics.timed("embed"):
+        return embedMany([query])[0]
 
-def embeddingDistance(first: np.ndarray, second: str) -> float:
-    return np.sum(np.square(np.subtract(first, embed(second))))
+def embeddingDistances(query: np.ndarray, candidates: np.ndarray) -> np.ndarray:
+    if len(candidates) == 0:
+        return np.zeros(0, dtype=np.float32)
+    return np.sum(np.square(np.subtract(candidates, query)), axis=1)
 
-emptyEmbeddings = {"metadatas": [[]], "distances": [[]]}
-def search(query: str, exactOnly: bool) -> list[ProductData]:
-    try:
-        embeddingMatches = emptyEmbeddings if exactOnly else products.query(query_texts=query, n_results=100)
-        directMatches = products.get(where_document={"$contains": query.lower()})
-    except cdberr.NotFoundError:
-        print("Database changed, restart required.")
-        return []
-    if embeddingMatches["metadatas"] != None and embeddingMatches["distances"] != None and directMatches["metadatas"] != None:
-        #query database for matches
-        embeddingInfos = [ProductData.model_validate(decomposeTags(meta)) for meta in embeddingMatches["metadatas"][0]]
-        directInfos = [ProductData.model_validate(decomposeTags(meta)) for meta in directMatches["metadatas"]]
-        directInfos = [pd for pd in directInfos if pd.matches(query)]
-
-        #remove direct matches
-        embeddingInfos = list(set(embeddingInfos) - set(directInfos))
-
-        # Pair productInfos with distances so sorting is easier.
-        infosDict = {i: (embeddingInfos[i], embeddingMatches["distances"][0][i]) for i in range(len(embeddingInfos))}
-        queryEmbedding = embed(query)
-        directsDict = {i: (directInfos[i], embeddingDistance(queryEmbedding, directInfos[i].text())) for i in range(len(directInfos))}
-
-        #sort by distance
-        infosList = list(infosDict.values())
-        infosList.sort(key=lambda t: t[1])
-        infosList.sort(key=lambda t: int(t[0].available), reverse=True)
-        directsList = list(directsDict.values())
-        directsList.sort(key=lambda t: t[1])
-        directsList.sort(key=lambda t: int(t[0].available), reverse=True)
-
-        #join back and return
-        finalList = [t[0] for t in directsList + infosList][:10]
-        finalList.sort(key=lambda pd: int(pd.available), reverse=True)
-        return finalList
-    else:
+emptyEmbeddings = {"ids": [[]], "metadatas": [[]], "distances": [[]]}
+# candidates fetched per result asked for, so deeper pages fetch deeper
+CANDIDATE_FACTOR = 10
+MAX_CANDIDATES = 1000
+def candidateDepth(limit: int, offset: int, candidates: int | None) -> int:
+    depth = candidates if candidates is not None else (offset + limit) * CANDIDATE_FACTOR
+    return min(max(depth, offset + limit), MAX_CANDIDATES)
+
+def directMatches(query: str, depth: int, filters: SearchFilters | None = None) -> tuple[list[tuple[str, float]], list[Mapping[str, object]]]:
+    with metrics.timed("text"):
+        textIndex = textIndexFile.current()
+        # the metadata is taken along, as a change applied once the lock is let go may remove the products
+        with textIndexFile.lock:
+            directRanked = textIndex.search(query, depth, filters)
+            directMetas = [textIndex.metadata(id) for id, _ in directRanked]
+    metrics.count("directHits", len(directRanked))
+    return directRanked, directMetas
+
+def storedEmbeddings(ids: list[str]) -> dict[str, np.ndarray]:
+    if len(ids) == 0:
+        return {}
+    with metrics.timed("stored"):
+        stored = fromStore(lambda store: store.get(ids=ids, include=["embeddings"]))
+    return dict(zip(stored["ids"], stored["embeddings"])) if stored["embeddings"] is not None else {}
+
+def vectorMatches(queryEmbedding: np.ndarray, depth: int, filters: SearchFilters | None = None):
+    # filters go into the vector query itself, so a filtered search still fills its candidates
+    where = filters.where() if filters is not None else None
+    with metrics.timed("vector"):
+        return fromStore(lambda store: store.query(query_embeddings=[queryEmbedding], n_results=depth, where=where))
+
+# a single token with both letters and digits, such as APP1700
+skuPattern = re.compile(r"^(?=.*[a-z])(?=.*[0-9])[a-z0-9-]+$", re.IGNORECASE)
+def skuMatch(textIndex: TextIndex, query: str, filters: SearchFilters | None) -> list[Candidate] | None:
+    if not settings.router.enabled or skuPattern.match(query.strip()) is None:
+        return None
+    with textIndexFile.lock:
+        id = textIndex.lookupSku(query, filters)
+        return None if id is None else [Candidate(id, textIndex.metadata(id), math.nan, True)]
+
+def keywordShaped(query: str) -> bool:
+    return settings.router.enabled and len(tokenise(query)) <= settings.router.keywordMaxTokens
+
+ROUTES = ("exact", "keyword", "semantic", "sku")
+def chooseRoute(query: str, exactOnly: bool, directRanked: list[tuple[str, float]], needed: int) -> str:
+    # short queries with enough direct matches to fill the page don't need an embedding
+    if exactOnly:
+        return "exact"
+    if keywordShaped(query) and len(directRanked) >= needed:
+        return "keyword"
+    return "semantic"
+
+def rank(directRanked: list[tuple[str, float]], directMetas: list[Mapping[str, object]], queryEmbedding: np.ndarray | None, embeddingMatches, stored: dict[str, np.ndarray], depth: int) -> list[Candidate]:
+    with metrics.timed("rank"):
+        ranked = rankCandidates(directRanked, directMetas, queryEmbedding, embeddingMatches, stored, depth)
+    metrics.count("candidates", len(ranked))
+    return ranked
+
+def rankCandidates(directRanked: list[tuple[str, float]], directMetas: list[Mapping[str, object]], queryEmbedding: np.ndarray | None, embeddingMatches, stored: dict[str, np.ndarray], depth: int) -> list[Candidate]:
+    if embeddingMatches["metadatas"] == None or embeddingMatches["distances"] == None:
         print("Malformed product data from query.")
         return []
-    
+    directIds = [id for id, _ in directRanked]
+    directDistances = np.full(len(directIds), np.nan)
+    if queryEmbedding is not None:
+        # score direct matches against the vectors already stored for them
+        embedded = [i for i, id in enumerate(directIds) if id in stored]
+        directDistances[embedded] = embeddingDistances(queryEmbedding, np.asarray([stored[directIds[i]] for i in embedded], dtype=np.float32))
+    direct = set(directIds)
+    others = [i for i, id in enumerate(embeddingMatches["ids"][0]) if id not in direct]
+    ids = directIds + [embeddingMatches["ids"][0][i] for i in others]
+    metadatas = directMetas + [embeddingMatches["metadatas"][0][i] for i in others]
+    exact = np.concatenate([np.ones(len(directIds)), np.zeros(len(others))])
+    lexical = np.concatenate([np.fromiter((score for _, score in directRanked), dtype=np.float64, count=len(directRanked)), np.zeros(len(others))])
+    distances = np.concatenate([directDistances, np.asarray(embeddingMatches["distances"][0], dtype=np.float64)[others]])
+    return fuse(ids, metadatas, exact, lexical, distances, depth)
+
+class SearchPage(NamedTuple):
+    results: list[ProductData]
+    cursor: str | None
+
+class RankedSearch(NamedTuple):
+    # what decides a ranking, which is all a cursor needs to carry for any worker to continue it
+    query: str
+    exactOnly: bool
+    depth: int
+    filters: SearchFilters | None
+    version: int
+    # whether the direct matches fill a page depends on the page, so later pages keep the route the first one took
+    route: str | None = None
+
+class CursorExpired(Exception):
+    pass
+
+def encodeCursor(search: RankedSearch, offset: int) -> str:
+    state = {"q": search.query, "e": search.exactOnly, "d": search.depth, "f": search.filters.model_dump() if search.filters is not None else None, "v": search.version, "r": search.route, "o": offset}
+    return base64.urlsafe_b64encode(json.dumps(state, separators=(",", ":")).encode()).decode().rstrip("=")
+
+def openCursor(cursor: str) -> tuple[RankedSearch, int]:
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        search = RankedSearch(str(state["q"]), bool(state["e"]), int(state["d"]), SearchFilters.model_validate(state["f"]) if state["f"] is not None else None, int(state["v"]), str(state["r"]))
+        offset = int(state["o"])
+    except (ValueError, KeyError, TypeError):
+        raise CursorExpired("Cursor expired or invalid.")
+    # any catalog write changes the ranking, so the pages the cursor continues no longer exist
+    if search.version != catalogVersion.current() or search.route not in ROUTES or not 0 < offset < min(search.depth, MAX_CANDIDATES):
+        raise CursorExpired("Cursor expired or invalid.")
+    return search, offset
+
+def paginate(ranked: list[Candidate], search: RankedSearch, limit: int, offset: int) -> SearchPage:
+    nextCursor = encodeCursor(search, offset + limit) if offset + limit < len(ranked) else None
+    with metrics.timed("materialise"):
+        return SearchPage(materialise(pageOf(ranked, offset, limit)), nextCursor)
+
+# ranked candidates and the route they took rather than pages, so every hit is paginated again and hands out a cursor that is still alive;
+# keys include the catalog version, so any catalog write makes every older entry unreachable
+resultCache = LRUCache[tuple, tuple[str, list[Candidate]]](settings.resultCache.maxBytes, settings.resultCache.ttlSeconds, lambda k, v: 256 + 512 * len(v[1])) if settings.resultCache.enabled else None
+def resultKey(search: RankedSearch) -> tuple:
+    return (search.version, normaliseText(search.query), search.exactOnly, search.depth, search.filters.key() if search.filters is not None else None)
+
+def cachedRanking(key: tuple, search: RankedSearch) -> tuple[str, list[Candidate]] | None:
+    # a cursor only takes an entry ranked by its own route, since another page of the same depth may have routed differently
+    cached = resultCache.get(key) if resultCache is not None else None
+    return cached if cached is not None and search.route in (None, cached[0]) else None
+
+def searchPage(query: str, exactOnly: bool, limit: int = 10, offset: int = 0, candidates: int | None = None, cursor: str | None = None, filters: SearchFilters | None = None) -> SearchPage:
+    with metrics.request():
+        return searchPageTraced(query, exactOnly, limit, offset, candidates, cursor, filters)
+
+def searchPageTraced(query: str, exactOnly: bool, limit: int = 10, offset: int = 0, candidates: int | None = None, cursor: str | None = None, filters: SearchFilters | None = None) -> SearchPage:
+    if cursor is not None:
+        search, offset = openCursor(cursor)
+        # cut to the cursor's depth, so the search keeps its key and its ranking
+        limit = min(limit, search.depth - offset)
+        query, exactOnly, depth, filters = search.query, search.exactOnly, search.depth, search.filters
+    else:
+        depth = candidateDepth(limit, offset, candidates)
+        search = RankedSearch(query, exactOnly, depth, filters, catalogVersion.current())
+    key = resultKey(search)
+    if (cached := cachedRanking(key, search)) is not None:
+        metrics.count("resultCacheHit")
+        metrics.routed("cursor" if cursor is not None else "cache")
+        route, ranked = cached
+        return paginate(ranked, search._replace(route=route), limit, offset)
+    if (skuRanked := skuMatch(textIndexFile.current(), query, filters)) is not None:
+        route, ranked = "sku", skuRanked
+        metrics.routed(route)
+    else:
+        directRanked, directMetas = directMatches(query, depth, filters)
+        route = search.route or chooseRoute(query, exactOnly, directRanked, offset + limit)
+        metrics.routed(route)
+        try:
+            # embed the query at most once, and only when the route needs it
+            queryEmbedding = embed(query) if route == "semantic" else None
+            embeddingMatches = emptyEmbeddings if queryEmbedding is None else vectorMatches(queryEmbedding, depth, filters)
+            stored = {} if queryEmbedding is None else storedEmbeddings([id for id, _ in directRanked])
+        except cdberr.NotFoundError:
+            print("Collection is being replaced, returning no results.")
+            return SearchPage([], None)
+        ranked = rank(directRanked, directMetas, queryEmbedding, embeddingMatches, stored, depth)
+    if resultCache is not None:
+        resultCache.put(key, (route, ranked))
+    return paginate(ranked, search._replace(route=route), limit, offset)
+
+def search(query: str, exactOnly: bool, limit: int = 10, offset: int = 0, candidates: int | None = None, filters: SearchFilters | None = None) -> list[ProductData]:
+    return searchPage(query, exactOnly, limit, offset, candidates, None, filters).results
+
+def searchChunk(queries: list[str], exactOnly: bool, limit: int, depth: int, filters: SearchFilters | None) -> list[tuple[str, list[Candidate]]]:
+    # one text index snapshot, one embedding call, one vector query and one stored embedding lookup for the whole chunk
+    with metrics.timed("text"):
+        textIndex = textIndexFile.current()
+        with textIndexFile.lock:
+            skuRanked = [skuMatch(textIndex, query, filters) for query in queries]
+            directRanked = [textIndex.search(query, depth, filters) if sku is None else [] for query, sku in zip(queries, skuRanked)]
+            directMetas = [[textIndex.metadata(id) for id, _ in ranked] for ranked in directRanked]
+    metrics.count("directHits", sum(len(ranked) for ranked in directRanked))
+    routes = ["sku" if sku is not None else chooseRoute(query, exactOnly, ranked, limit) for query, sku, ranked in zip(queries, skuRanked, directRanked)]
+    for route in set(routes):
+        metrics.routed(route, routes.count(route))
+    # only the queries routed to the embedder are embedded
+    semantic = [i for i, route in enumerate(routes) if route == "semantic"]
+    queryEmbeddings: list[np.ndarray | None] = [None] * len(queries)
+    embeddingMatches = [emptyEmbeddings] * len(queries)
+    stored: dict[str, np.ndarray] = {}
+    if len(semantic) > 0:
+        with metrics.timed("embed"):
+            embedded = list(embedMany([queries[i] for i in semantic]))
+        with metrics.timed("vector"):
+            found = fromStore(lambda store: store.query(query_embeddings=np.asarray(embedded), n_results=depth, where=filters.where() if filters is not None else None))
+        for i, queryEmbedding, ids, metas, distances in zip(semantic, embedded, found["ids"], found["metadatas"] or [], found["distances"] or []):
+            queryEmbeddings[i] = queryEmbedding
+            embeddingMatches[i] = {"ids": [ids], "metadatas": [metas], "distances": [distances]}
+        stored = storedEmbeddings(list({id for i in semantic for id, _ in directRanked[i]}))
+    return [(route, sku if sku is not None else rank(ranked, metas, queryEmbedding, matches, stored, depth)) for route, sku, ranked, metas, queryEmbedding, matches in zip(routes, skuRanked, directRanked, directMetas, queryEmbeddings, embeddingMatches)]
+
+def searchBatch(queries: list[str], exactOnly: bool, limit: int = 10, candidates: int | None = None, filters: SearchFilters | None = None) -> list[SearchPage]:
+    with metrics.request():
+        depth = candidateDepth(limit, 0, candidates)
+        version = catalogVersion.current()
+        searches = [RankedSearch(query, exactOnly, depth, filters, version) for query in queries]
+        keys = [resultKey(search) for search in searches]
+        pages: dict[tuple, SearchPage] = {}
+        pending: dict[tuple, RankedSearch] = {}
+        for key, search in zip(keys, searches):
+            if key in pages or key in pending:
+                continue
+            if (cached := cachedRanking(key, search)) is not None:
+                metrics.count("resultCacheHit")
+                metrics.routed("cache")
+                route, ranked = cached
+                pages[key] = paginate(ranked, search._replace(route=route), limit, 0)
+            else:
+                pending[key] = search
+        chunks = list(pending.items())
+        for start in range(0, len(chunks), settings.search.batchChunk):
+            chunk = chunks[start:start + settings.search.batchChunk]
+            try:
+                chunkRanked = searchChunk([search.query for _, search in chunk], exactOnly, limit, depth, filters)
+            except cdberr.NotFoundError:
+                print("Collection is being replaced, returning no results.")
+                for key, _ in chunk:
+                    pages[key] = SearchPage([], None)
+                continue
+            for (key, search), (route, ranked) in zip(chunk, chunkRanked):
+                pages[key] = paginate(ranked, search._replace(route=route), limit, 0)
+                if resultCache is not None:
+                    resultCache.put(key, (route, ranked))
+        return [pages[key] for key in keys]
+
+def suggest(prefix: str, limit: int = 10) -> list[Suggestion]:
+    # completions come from the text index alone, so typeahead never waits on Ollama or chromadb
+    with metrics.timed("suggest"):
+        textIndex = textIndexFile.current()
+        with textIndexFile.lock:
+            completions = textIndex.prefixes.complete(prefix, limit)
+    return [Suggestion(text=c.text, kind=c.kind, count=c.count) for c in completions]
+
+executor = ThreadPoolExecutor(max_workers=settings.search.workers, thread_name_prefix="search")
+async def stage[T](function: Callable[..., T], *args: Any, timeout: float | None) -> T:
+    # executor threads don't inherit the request's trace unless the context is carried over
+    return await asyncio.wait_for(asyncio.get_running_loop().run_in_executor(executor, contextvars.copy_context().run, function, *args), timeout)
+
+async def semanticAsync(query: str, depth: int, filters: SearchFilters | None) -> tuple[np.ndarray | None, Any]:
+    try:
+        queryEmbedding = await stage(embed, query, timeout=settings.search.embedTimeout)
+        return queryEmbedding, await stage(vectorMatches, queryEmbedding, depth, filters, timeout=settings.search.vectorTimeout)
+    except asyncio.TimeoutError:
+        print("Embedding search timed out, returning direct matches only.")
+        return None, emptyEmbeddings
+
+async def searchAsync(query: str, exactOnly: bool, limit: int = 10, offset: int = 0, candidates: int | None = None, cursor: str | None = None, filters: SearchFilters | None = None) -> SearchPage:
+    with metrics.request():
+        return await searchAsyncTraced(query, exactOnly, limit, offset, candidates, cursor, filters)
+
+async def searchAsyncTraced(query: str, exactOnly: bool, limit: int = 10, offset: int = 0, candidates: int | None = None, cursor: str | None = None, filters: SearchFilters | None = None) -> SearchPage:
+    if cursor is not None:
+        search, offset = openCursor(cursor)
+        # cut to the cursor's depth, so the search keeps its key and its ranking
+        limit = min(limit, search.depth - offset)
+        query, exactOnly, candidates, filters = search.query, search.exactOnly, search.depth, search.filters
+    page = SearchPage([], None)
+    # the generator runs to its end, so its cleanup runs here rather than whenever it is collected
+    async for phase in searchPhases(query, exactOnly, limit, offset, candidates, filters, search.route if cursor is not None else None):
+        if isinstance(phase, SearchPage):
+            page = phase
+    return page
+
+async def searchPhases(query: str, exactOnly: bool, limit: int, offset: int, candidates: int | None, filters: SearchFilters | None, route: str | None = None) -> AsyncIterator[list[Candidate] | SearchPage]:
+    # yields the direct matches as soon as they are known if an embedding is still to come, then the ranked page; a cursor passes the route of its first page
+    depth = candidateDepth(limit, offset, candidates)
+    search = RankedSearch(query, exactOnly, depth, filters, catalogVersion.current(), route)
+    key = resultKey(search)
+    if (cached := cachedRanking(key, search)) is not None:
+        metrics.count("resultCacheHit")
+        metrics.routed("cursor" if route is not None else "cache")
+        route, ranked = cached
+        yield paginate(ranked, search._replace(route=route), limit, offset)
+        return
+    textIndex = await stage(textIndexFile.current, timeout=settings.search.textTimeout)
+    if (skuRanked := skuMatch(textIndex, query, filters)) is not None:
+        metrics.routed("sku")
+        if resultCache is not None:
+            resultCache.put(key, ("sku", skuRanked))
+        yield paginate(skuRanked, search._replace(route="sku"), limit, offset)
+        return
+    # natural language always needs the embedding, so the embedding and vector query run alongside the text match and the stored embedding lookup;
+    # for shorter queries the text search decides whether it is needed at all
+    early = route == "semantic" if route is not None else not exactOnly and not keywordShaped(query)
+    semantic = asyncio.ensure_future(semanticAsync(query, depth, filters)) if early else None
+    stored: dict[str, np.ndarray] = {}
+    queryEmbedding, embeddingMatches = None, emptyEmbeddings
+    try:
+        directRanked, directMetas = await stage(directMatches, query, depth, filters, timeout=settings.search.textTimeout)
+        route = route or ("semantic" if semantic is not None else chooseRoute(query, exactOnly, directRanked, offset + limit))
+        metrics.routed(route)
+        if route == "semantic":
+            yield [Candidate(id, meta, math.nan, True, score) for (id, score), meta in zip(directRanked[offset:offset + limit], directMetas[offset:offset + limit])]
+            if semantic is None:
+                semantic = asyncio.ensure_future(semanticAsync(query, depth, filters))
+            stored = await stage(storedEmbeddings, [id for id, _ in directRanked], timeout=settings.search.vectorTimeout)
+            queryEmbedding, embeddingMatches = await semantic
+    except cdberr.NotFoundError:
+        print("Collection is being replaced, returning no results.")
+        yield SearchPage([], None)
+        return
+    finally:
+        if semantic is not None:
+            semantic.cancel()
+    ranked = rank(directRanked, directMetas, queryEmbedding, embeddingMatches, stored, depth)
+    # results degraded by an embedding timeout are not worth keeping
+    if resultCache is not None and (semantic is None or queryEmbedding is not None):
+        resultCache.put(key, (route, ranked))
+    yield paginate(ranked, search._replace(route=route), limit, offset)
+
+async def searchStream(query: str, exactOnly: bool, limit: int = 10, candidates: int | None = None, filters: SearchFilters | None = None) -> AsyncIterator[tuple[Literal["exact", "ranked"], list[ProductData]]]:
+    # direct matches first, then the rest of the ranked page; nothing is sent twice
+    sent: set[str] = set()
+    async for phase in searchPhases(query, exactOnly, limit, 0, candidates, filters):
+        if isinstance(phase, SearchPage):
+            # rows already shown can't be taken back, so the ranked rows only fill what is left of the page
+            yield "ranked", [product for product in phase.results if product.sku not in sent][:limit - len(sent)]
+        else:
+            sent.update(candidate.id for candidate in phase)
+            with metrics.timed("materialise"):
+                exact = materialise(phase)
+            yield "exact", exact
+
+async def searchBatchAsync(queries: list[str], exactOnly: bool, limit: int = 10, candidates: int | None = None, filters: SearchFilters | None = None) -> list[SearchPage]:
+    # a batch is one long job, so it gets a worker thread but no stage timeouts
+    return await stage(searchBatch, queries, exactOnly, limit, candidates, filters, timeout=None)
+
 # search full database for textual matches
 # allow user to choose between specifics (textual match and above certain confidence threshold) or plus recommended
 # better data encapsulation (put field names and delimiters into the string to be emebdded)
@@ -0,0 +1,59 @@
+import heapq
+import numpy as np
+from typing import Iterable, Mapping
+try:
+    from src.config import RankingSettings, settings
+    from src.models import ProductData, decomposeTags
+except ModuleNotFoundError:
+    from config import RankingSettings, settings
+    from models import ProductData, decomposeTags
+
+class Candidate:
+    # one per product id; ProductData is only built for the candidates that are returned
+    __slots__ = ("id", "metadata", "distance", "exact", "lexical", "available")
+
+    def __init__(self, id: str, metadata: Mapping[str, object], distance: float, exact: bool, lexical: float = 0.0) -> None:
+        self.id = id
+        self.metadata = metadata
+        # squared L2 to the query embedding, NaN when there is none
+        self.distance = distance
+        self.exact = exact
+        # BM25 score, 0 for products that aren't direct matches
+        self.lexical = lexical
+        self.available = bool(metadata.get("available", True))
+
+def ranks(values: np.ndarray, present: np.ndarray) -> np.ndarray:
+    # 1-based positions when sorted ascending, among the present values only
+    order = np.flatnonzero(present)[np.argsort(values[present], kind="stable")]
+    positions = np.full(len(values), np.inf)
+    positions[order] = np.arange(1, len(order) + 1)
+    return positions
+
+def fusedScores(exact: np.ndarray, lexical: np.ndarray, distance: np.ndarray, available: np.ndarray, weights: RankingSettings) -> np.ndarray:
+    embedded = ~np.isnan(distance)
+    if weights.method == "rrf":
+        # reciprocal rank fusion of the lexical and embedding rankings; exact and available count as ranking first
+        return (
+            weights.lexical / (weights.rrfK + ranks(-lexical, lexical > 0))
+            + weights.similarity / (weights.rrfK + ranks(distance, embedded))
+            + (weights.exact * exact + weights.available * available) / weights.rrfK
+        )
+    best = lexical.max() if len(lexical) > 0 else 0
+    # BM25 relative to the best match in the set; for unit vectors, 1 - d/2 is the cosine similarity
+    lexicalScore = lexical / best if best > 0 else np.zeros(len(lexical))
+    similarity = np.where(embedded, 1 - np.nan_to_num(distance) / 2, 0)
+    return weights.exact * exact + weights.lexical * lexicalScore + weights.similarity * similarity + weights.available * available
+
+def fuse(ids: list[str], metadatas: list[Mapping[str, object]], exact: np.ndarray, lexical: np.ndarray, distance: np.ndarray, k: int, weights: RankingSettings = settings.ranking) -> list[Candidate]:
+    # signals arrive as columns, so only the k returned candidates become objects
+    available = np.fromiter((bool(meta.get("available", True)) for meta in metadatas), dtype=np.float64, count=len(metadatas))
+    scores = fusedScores(exact, lexical, distance, available, weights).tolist()
+    return [Candidate(ids[i], metadatas[i], distance[i], bool(exact[i]), lexical[i]) for i in heapq.nlargest(k, range(len(scores)), key=scores.__getitem__)]
+
+def pageOf(ranked: list[Candidate], offset: int, limit: int) -> list[Candidate]:
+    page = ranked[offset:offset + limit]
+    page.sort(key=lambda c: not c.available)
+    return page
+
+def materialise(candidates: Iterable[Candidate]) -> list[ProductData]:
+    return [ProductData.model_validate(decomposeTags(c.metadata)) for c in candidates]
@@ -0,0 +1,116 @@
+import re
+import zlib
+import heapq
+import itertools
+import chromadb as cdb
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
+from typing import Any, Mapping, Sequence
+try:
+    from src.config import settings
+except ModuleNotFoundError:
+    from config import settings
+
+COLUMNS = ("embeddings", "metadatas", "documents")
+# a thread per shard, so every shard is queried at once
+executor = ThreadPoolExecutor(max_workers=max(settings.shards.count, 1), thread_name_prefix="shard")
+
+def shardNames(name: str) -> list[str]:
+    count = settings.shards.count
+    return [name] if count <= 1 else [f"{name}-{shard}" for shard in range(count)]
+
+def shardOf(id: str, count: int) -> int:
+    # SKUs start with their category, so sharding by prefix keeps each category in one shard
+    key = id[:settings.shards.prefixLength].upper() if settings.shards.by == "prefix" else id
+    # crc32 rather than hash(), which differs between processes
+    return zlib.crc32(key.encode()) % count
+
+class ShardedCollection:
+    # a collection split over several, answering the same calls as a chroma collection: writes go to each id's shard, queries go to every shard
+    def __init__(self, name: str, shards: list[cdb.Collection]) -> None:
+        self.name = name
+        self.shards = shards
+
+    @property
+    def id(self) -> tuple:
+        return tuple(shard.id for shard in self.shards)
+
+    def count(self) -> int:
+        return sum(executor.map(lambda shard: shard.count(), self.shards))
+
+    def groups(self, ids: Sequence[str]) -> list[tuple[cdb.Collection, list[int]]]:
+        rows: list[list[int]] = [[] for _ in self.shards]
+        for row, id in enumerate(ids):
+            rows[shardOf(id, len(self.shards))].append(row)
+        # chroma refuses empty id lists, so shards without rows are left out
+        return [(shard, shardRows) for shard, shardRows in zip(self.shards, rows) if len(shardRows) > 0]
+
+    def write(self, method: str, ids: Sequence[str], columns: Mapping[str, Any]) -> None:
+        def writeShard(shard: cdb.Collection, rows: list[int]) -> None:
+            getattr(shard, method)([ids[row] for row in rows], **{key: [values[row] for row in rows] for key, values in columns.items() if values is not None})
+        # list() so a shard that failed raises here
+        list(executor.map(lambda group: writeShard(*group), self.groups(ids)))
+
+    def add(self, ids: Sequence[str], **columns: Any) -> None:
+        self.write("add", ids, columns)
+
+    def upsert(self, ids: Sequence[str], **columns: Any) -> None:
+        self.write("upsert", ids, columns)
+
+    def update(self, ids: Sequence[str], **columns: Any) -> None:
+        self.write("update", ids, columns)
+
+    def delete(self, ids: Sequence[str]) -> None:
+        self.write("delete", ids, {})
+
+    def get(self, ids: Sequence[str] | None = None, include: Sequence[str] = ("metadatas", "documents"), limit: int | None = None, offset: int | None = None) -> dict[str, Any]:
+        if ids is not None:
+            pages = list(executor.map(lambda group: group[0].get(ids=[ids[row] for row in group[1]], include=include), self.groups(ids))) # type: ignore
+        else:
+            # pages run through the shards in order, as if they were one collection
+            pages = []
+            skip, remaining = offset or 0, limit
+            for shard in self.shards:
+                if remaining is not None and remaining <= 0:
+                    break
+                size = shard.count()
+                if skip >= size:
+                    skip -= size
+                    continue
+                page = shard.get(include=include, limit=remaining, offset=skip) # type: ignore
+                pages.append(page)
+                skip = 0
+                if remaining is not None:
+                    remaining -= len(page["ids"])
+        merged: dict[str, Any] = {"ids": [id for page in pages for id in page["ids"]]}
+        for key in COLUMNS:
+            merged[key] = [value for page in pages for value in page[key]] if key in include else None
+        return merged
+
+    def peek(self, limit: int = 10) -> dict[str, Any]:
+        return self.get(include=COLUMNS, limit=limit)
+
+    def query(self, query_embeddings: Any, n_results: int = 10, where: Mapping[str, Any] | None = None) -> dict[str, list[list[Any]]]:
+        # shards only send distances, metadata is fetched for the merged top k alone
+        found = list(executor.map(lambda shard: shard.query(query_embeddings=query_embeddings, n_results=n_results, where=where, include=["distances"]), self.shards)) # type: ignore
+        merged: dict[str, list[list[Any]]] = {"ids": [], "metadatas": [], "distances": []}
+        for query in range(len(found[0]["ids"])):
+            # each shard's matches come sorted by distance, so the global top k is the head of their merge
+            best = list(itertools.islice(heapq.merge(*(zip(shard["distances"][query], shard["ids"][query]) for shard in found), key=itemgetter(0)), n_results)) # type: ignore
+            merged["distances"].append([distance for distance, _ in best])
+            merged["ids"].append([id for _, id in best])
+        stored = self.get(ids=list({id for ids in merged["ids"] for id in ids}), include=["metadatas"])
+        metadatas = dict(zip(stored["ids"], stored["metadatas"]))
+        merged["metadatas"] = [[metadatas[id] for id in ids] for ids in merged["ids"]]
+        return merged
+
+def openCollection(client: Any, name: str, embeddingFunction: Any, create: bool = True) -> cdb.Collection | ShardedCollection:
+    open = client.get_or_create_collection if create else client.get_collection
+    shards = [open(shardName, embedding_function=embeddingFunction) for shardName in shardNames(name)]
+    return shards[0] if len(shards) == 1 else ShardedCollection(name, shards)
+
+def deleteCollection(client: Any, name: str) -> None:
+    # shards left over from a different shard count are deleted too
+    for collection in client.list_collections():
+        if collection.name == name or re.fullmatch(re.escape(name) + r"-\d+", collection.name) is not None:
+            client.delete_collection(collection.name)
@@ -0,0 +1,92 @@
+import os
+import json
+import numpy as np
+import chromadb as cdb
+from typing import Any, NamedTuple
+try:
+    from src.config import settings
+    from src.flatstore import PAGE_SIZE, FlatStore
+    from src.models import tagKey
+    from src.shards import ShardedCollection
+    from src.store import catalogVersion
+    from src.textindex import TextIndex, splitTags
+except ModuleNotFoundError:
+    from config import settings
+    from flatstore import PAGE_SIZE, FlatStore
+    from models import tagKey
+    from shards import ShardedCollection
+    from store import catalogVersion
+    from textindex import TextIndex, splitTags
+
+SNAPSHOT_FORMAT = 1
+
+class Snapshot(NamedTuple):
+    store: FlatStore
+    documents: list[str]
+
+def exportSnapshot(path: str, collection: cdb.Collection | ShardedCollection) -> int:
+    # a float32 flat store with the embedded text beside it, so it can also be served as the flat vector index
+    return FlatStore.build(path, collection, "float32", {"model": settings.embeddingModel, "catalogVersion": catalogVersion.current(), "snapshot": SNAPSHOT_FORMAT}, documents=True) # type: ignore
+
+def loadSnapshot(path: str) -> Snapshot | None:
+    try:
+        store = FlatStore(path)
+        with open(os.path.join(path, "documents.json")) as file:
+            documents: list[str] = json.load(file)
+    except FileNotFoundError:
+        print(f"{path} is not a catalog snapshot.")
+        return None
+    # stored embeddings are only comparable with query embeddings from the same model
+    if store.manifest.get("model") != settings.embeddingModel:
+        print(f"The snapshot was embedded with {store.manifest.get("model")}, but {settings.embeddingModel} is configured.")
+        return None
+    return Snapshot(store, documents)
+
+def restoredMetadata(store: FlatStore, row: int) -> dict[str, Any]:
+    # tag flags aren't kept in snapshots, so they are derived from the tags column again
+    metadata = store.metadata(row)
+    return metadata | {tagKey(tag): True for tag in splitTags(metadata.get("tags", "")) if tag.strip() != ""}
+
+def restoreSnapshot(snapshot: Snapshot, collection: cdb.Collection | ShardedCollection, index: TextIndex) -> int:
+    store = snapshot.store
+    for start in range(0, len(store), PAGE_SIZE):
+        stop = min(start + PAGE_SIZE, len(store))
+        ids = store.ids[start:stop]
+        metadatas = [restoredMetadata(store, row) for row in range(start, stop)]
+        # the stored embeddings are written as they are, so nothing is sent to the embedder
+        collection.add(ids, embeddings=np.asarray(store.vectors[start:stop]), metadatas=metadatas, documents=snapshot.documents[start:stop]) # type: ignore
+        for id, metadata in zip(ids, metadatas):
+            index.put(id, metadata)
+        print(f"{stop}/{len(store)} products restored")
+    index.save(settings.textIndexPath)
+    catalogVersion.bump()
+    return len(store)
+
+if __name__ == "__main__":
+    import time
+    import argparse
+    try:
+        from src.embedding import OllamaEmbedder
+        from src.shards import deleteCollection, openCollection
+        from src.store import openTextIndex
+    except ModuleNotFoundError:
+        from embedding import OllamaEmbedder
+        from shards import deleteCollection, openCollection
+        from store import openTextIndex
+
+    parser = argparse.ArgumentParser(description="Export the catalog to a snapshot, or replace it with one, without embedding anything.")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("path", help="the snapshot directory")
+    args = parser.parse_args()
+    chroma = cdb.PersistentClient()
+    start = time.monotonic()
+    if args.command == "export":
+        count = exportSnapshot(args.path, openCollection(chroma, "products", OllamaEmbedder()))
+        print(f"Finished! {count} products exported in {time.monotonic() - start:.1f}s.")
+    elif (snapshot := loadSnapshot(args.path)) is not None:
+        deleteCollection(chroma, "products")
+        products = openCollection(chroma, "products", OllamaEmbedder())
+        textIndex = openTextIndex(products)
+        textIndex.clear()
+        count = restoreSnapshot(snapshot, products, textIndex)
+        print(f"Finished! {count} products restored in {time.monotonic() - start:.1f}s.")
@@ -0,0 +1,121 @@
+import os
+import fcntl
+import threading
+import chromadb as cdb
+import chromadb.errors as cdberr
+from typing import Any
+try:
+    from src.config import settings
+    from src.models import DBProductData
+    from src.shards import ShardedCollection, openCollection
+    from src.textindex import TextIndex
+except ModuleNotFoundError:
+    from config import settings
+    from models import DBProductData
+    from shards import ShardedCollection, openCollection
+    from textindex import TextIndex
+
+class CatalogVersion:
+    # a counter every catalog write bumps, shared between processes through a small file
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.mtime: int | None = None
+        self.value = 0
+
+    def read(self) -> int:
+        try:
+            with open(self.path) as file:
+                return int(file.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def current(self) -> int:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return self.value
+        if mtime != self.mtime:
+            self.value = self.read()
+            self.mtime = mtime
+        return self.value
+
+    def bump(self) -> int:
+        value = self.read() + 1
+        with open(self.path + ".tmp", "w") as file:
+            file.write(str(value))
+        os.replace(self.path + ".tmp", self.path)
+        return value
+
+catalogVersion = CatalogVersion(settings.catalogVersionPath)
+
+class CollectionHandle:
+    # a collection that is reopened in place when the management CLI replaces it
+    def __init__(self, client: Any, name: str, embeddingFunction: Any) -> None:
+        self.client = client
+        self.name = name
+        self.embeddingFunction = embeddingFunction
+        self.lock = threading.Lock()
+        self.version = catalogVersion.current()
+        self.collection = openCollection(client, name, embeddingFunction)
+
+    def current(self) -> cdb.Collection | ShardedCollection:
+        # replacing the collection bumps the catalog version, so it is only looked up again then
+        version = catalogVersion.current()
+        return self.collection if version == self.version else self.reopen(version)
+
+    def reopen(self, version: int | None = None) -> cdb.Collection | ShardedCollection:
+        with self.lock:
+            if version is not None and version == self.version:
+                return self.collection
+            try:
+                collection = openCollection(self.client, self.name, self.embeddingFunction, create=False)
+            except cdberr.NotFoundError:
+                # deleted but not yet recreated, so look again on the next call
+                return self.collection
+            self.version = catalogVersion.current() if version is None else version
+            # one assignment, so requests holding the old handle finish with it and new ones get the replacement
+            if collection.id != self.collection.id:
+                print(f"Collection {self.name} was replaced, reopened it.")
+                self.collection = collection
+            return self.collection
+
+def openTextIndex(collection: cdb.Collection) -> TextIndex:
+    if os.path.isfile(settings.textIndexPath):
+        return TextIndex.load(settings.textIndexPath)
+    with open(settings.textIndexPath + ".lock", "w") as lock:
+        # processes starting together build a missing index once, the others wait and load it rather than writing the same file
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if os.path.isfile(settings.textIndexPath):
+            return TextIndex.load(settings.textIndexPath)
+        return buildTextIndex(collection)
+
+def ensureTextIndex(collection: cdb.Collection) -> None:
+    # for the server, which loads the file itself, so an existing one isn't read here as well
+    if not os.path.isfile(settings.textIndexPath):
+        openTextIndex(collection)
+
+def buildTextIndex(collection: cdb.Collection) -> TextIndex:
+    print("Building text index...")
+    index = TextIndex()
+    offset = 0
+    while True:
+        page = collection.get(include=["metadatas"], limit=1000, offset=offset)
+        if len(page["ids"]) == 0 or page["metadatas"] == None:
+            break
+        for id, meta in zip(page["ids"], page["metadatas"]):
+            index.put(id, meta)
+        offset += len(page["ids"])
+    index.save(settings.textIndexPath)
+    return index
+
+def writeEntries(collection: cdb.Collection, index: TextIndex, entries: list[DBProductData], upsert: bool) -> None:
+    if upsert:
+        collection.upsert([pd.id for pd in entries], metadatas=[pd.metadata for pd in entries], documents=[pd.text for pd in entries])
+    else:
+        collection.add([pd.id for pd in entries], metadatas=[pd.metadata for pd in entries], documents=[pd.text for pd in entries])
+    # add() leaves existing ids untouched, so the index does too
+    for pd in entries:
+        if upsert or pd.id not in index:
+            index.put(pd.id, pd.metadata)
+    index.save(settings.textIndexPath)
+    catalogVersion.bump()
@@ -0,0 +1,105 @@
+import re
+import heapq
+import bisect
+import numpy as np
+from typing import Literal, NamedTuple
+
+type SuggestionKind = Literal["name", "tag", "sku"]
+SEPARATOR = "\0"
+# prefixes matching more keys than this are few and asked for constantly, so their completions are remembered
+MEMO_RANGE = 4096
+spacePattern = re.compile(r"\s+")
+
+def normalisePrefix(text: str) -> str:
+    return spacePattern.sub(" ", text).strip().lower()
+
+class Completion(NamedTuple):
+    text: str
+    kind: SuggestionKind
+    count: int
+
+class PrefixIndex:
+    # sorted-array prefix index: a big sorted run plus a small sorted run of recent keys, merged geometrically
+    def __init__(self) -> None:
+        # key is "<normalised text>\0<kind>", so one prefix range covers every kind
+        self.counts: dict[str, int] = {}
+        self.display: dict[str, str] = {}
+        self.keys: list[str] = []
+        self.weights = np.zeros(0, dtype=np.int64)
+        self.recent: list[str] = []
+        self.zeroes = 0
+        self.memo: dict[tuple[str, int], list[Completion]] = {}
+
+    def __len__(self) -> int:
+        return len(self.counts) - self.zeroes
+
+    def add(self, text: str, kind: SuggestionKind) -> None:
+        normalised = normalisePrefix(text)
+        if normalised == "":
+            return
+        key = normalised + SEPARATOR + kind
+        count = self.counts.get(key)
+        self.memo.clear()
+        if count is None:
+            self.counts[key] = 1
+            self.display[key] = text.strip()
+            bisect.insort(self.recent, key)
+            if len(self.recent) > max(4096, len(self.keys) // 8):
+                self.merge()
+            return
+        if count == 0:
+            self.zeroes -= 1
+        self.setCount(key, count + 1)
+
+    def discard(self, text: str, kind: SuggestionKind) -> None:
+        key = normalisePrefix(text) + SEPARATOR + kind
+        count = self.counts.get(key, 0)
+        if count == 0:
+            return
+        self.memo.clear()
+        # emptied keys stay in the runs until there are enough of them to be worth a rebuild
+        self.setCount(key, count - 1)
+        if count == 1:
+            self.zeroes += 1
+            if self.zeroes > 4096 and self.zeroes > len(self.counts) // 4:
+                self.merge()
+
+    def setCount(self, key: str, count: int) -> None:
+        self.counts[key] = count
+        position = bisect.bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            self.weights[position] = count
+
+    def merge(self) -> None:
+        keys = sorted(self.keys + self.recent)
+        for key in (k for k in keys if self.counts[k] == 0):
+            del self.counts[key], self.display[key]
+        self.keys = [key for key in keys if key in self.counts]
+        self.weights = np.fromiter((self.counts[key] for key in self.keys), dtype=np.int64, count=len(self.keys))
+        self.recent = []
+        self.zeroes = 0
+
+    def complete(self, prefix: str, limit: int = 10) -> list[Completion]:
+        normalised = normalisePrefix(prefix)
+        if normalised == "":
+            return []
+        # every key starting with the prefix sorts between it and the prefix followed by the highest code point
+        start = bisect.bisect_left(self.keys, normalised)
+        stop = bisect.bisect_left(self.keys, normalised + "\U0010ffff", lo=start)
+        if stop - start > MEMO_RANGE and (normalised, limit) in self.memo:
+            return self.memo[normalised, limit]
+        weights = self.weights[start:stop]
+        best = np.flatnonzero(weights > 0)
+        if len(best) > limit:
+            # most products first, then alphabetical; ranges can be long, so only the best few are sorted
+            order = -weights[best] * (len(weights) + 1) + best
+            best = best[np.argpartition(order, limit - 1)[:limit]]
+        found = [(int(weights[i]), self.keys[start + i]) for i in best.tolist()]
+        recentStart = bisect.bisect_left(self.recent, normalised)
+        recentStop = bisect.bisect_left(self.recent, normalised + "\U0010ffff", lo=recentStart)
+        found.extend((self.counts[key], key) for key in self.recent[recentStart:recentStop])
+        top = heapq.nsmallest(limit, ((-count, key) for count, key in found if count > 0))
+        completions = [Completion(self.display[key], key.rsplit(SEPARATOR, 1)[1], -count) for count, key in top] # type: ignore
+        if stop - start > MEMO_RANGE:
+            self.memo[normalised, limit] = completions
+        return completions
@@ -0,0 +1,472 @@
+import os
+import re
+import math
+import time
+import pickle
+import secrets
+import threading
+import numpy as np
+from array import array
+from collections import Counter
+from contextlib import AbstractContextManager
+from typing import Callable, Mapping
+try:
+    from src.models import SearchFilters
+    from src.suggest import PrefixIndex, SuggestionKind
+except ModuleNotFoundError:
+    from models import SearchFilters
+    from suggest import PrefixIndex, SuggestionKind
+
+tokenPattern = re.compile(r"[a-z0-9]+")
+def tokenise(text: str) -> list[str]:
+    return tokenPattern.findall(text.lower())
+
+def trigrams(text: str) -> set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def splitTags(tags: object) -> list[str]:
+    if isinstance(tags, str):
+        tags = tags.split(";")
+    return [str(t).lower() for t in tags if t != ""] if isinstance(tags, list) else []
+
+emptyHits = np.zeros(0, dtype=np.uint32)
+# trigram candidates checked per step of the substring search
+SUBSTRING_BLOCK = 1024
+# a save rewrites the whole file, and starts a new log, once the log holds more records than this share of the index
+COMPACT_RATIO = 0.5
+COMPACT_MIN = 4096
+# what says where the index is in its log rather than what it holds, so it isn't part of the saved state
+LOG_STATE = ("lineage", "sequence", "journal", "logged")
+# bumped whenever what is indexed for a product changes
+FORMAT = 2
+
+type LogRecord = tuple[int, tuple]
+
+def readHeader(path: str) -> dict[str, object]:
+    # the first object in the file, so the lineage and sequence are known without loading the index
+    with open(path, "rb") as file:
+        return pickle.load(file)
+
+class TextIndex:
+    # BM25 parameters
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self) -> None:
+        # the log's records are numbered from 1 within a lineage, which a fresh index starts
+        self.lineage = secrets.token_hex(8)
+        self.sequence = 0
+        self.journal: list[LogRecord] = []
+        self.logged = 0
+        self.reset()
+
+    def reset(self) -> None:
+        # documents are numbered in insertion order; removed numbers are tombstoned, never reused
+        self.ids: list[str | None] = []
+        self.numbers: dict[str, int] = {}
+        self.metadatas: list[Mapping[str, object] | None] = []
+        self.texts: list[str] = []
+        self.lengths = array("I")
+        self.alive = bytearray()
+        self.totalLength = 0
+        self.deleted = 0
+        self.postings: dict[str, tuple[array, array]] = {}
+        self.documentFrequency: dict[str, int] = {}
+        self.grams: dict[str, array] = {}
+        self.tagDocs: dict[str, array] = {}
+        self.skus: dict[str, int] = {}
+        # columns for structured filters, NaN where a product has no price
+        self.prices = array("d")
+        self.availability = bytearray()
+        self.prefixes = PrefixIndex()
+        self.impactCache: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        self.format = FORMAT
+
+    def __len__(self) -> int:
+        return len(self.numbers)
+
+    def __contains__(self, id: str) -> bool:
+        return id in self.numbers
+
+    def metadata(self, id: str) -> Mapping[str, object]:
+        return self.metadatas[self.numbers[id]] # type: ignore
+
+    @staticmethod
+    def fields(id: str, metadata: Mapping[str, object]) -> tuple[str, str, list[str], str]:
+        return str(metadata.get("name", "")).lower(), str(metadata.get("desc", "")).lower(), splitTags(metadata.get("tags", "")), str(metadata.get("sku", id)).lower()
+
+    @staticmethod
+    def terms(name: str, desc: str, tags: list[str], sku: str) -> Counter[str]:
+        # each tag is one whole term, like in tagDocs, so a product tagged "no coffee" isn't a match for "coffee"
+        return Counter(tokenise(" ".join([name, desc, sku])) + tags)
+
+    @staticmethod
+    def suggestions(id: str, metadata: Mapping[str, object], apply: Callable[[str, SuggestionKind], None]) -> None:
+        # completions keep the catalog's own casing
+        apply(str(metadata.get("name", "")), "name")
+        for tag in set(splitTags(metadata.get("tags", ""))):
+            apply(tag, "tag")
+        apply(str(metadata.get("sku", id)), "sku")
+
+    def record(self, *change: object) -> None:
+        self.sequence += 1
+        self.journal.append((self.sequence, change))
+
+    def apply(self, sequence: int, change: tuple) -> None:
+        kind, *args = change
+        if kind == "put":
+            self.insert(*args)
+        elif kind == "remove":
+            self.drop(*args)
+        else:
+            self.reset()
+        self.sequence = sequence
+
+    def put(self, id: str, metadata: Mapping[str, object]) -> None:
+        metadata = dict(metadata)
+        self.record("put", id, metadata)
+        self.insert(id, metadata)
+
+    def remove(self, id: str) -> None:
+        if id in self.numbers:
+            self.record("remove", id)
+            self.drop(id)
+
+    def clear(self) -> None:
+        self.record("clear")
+        self.reset()
+
+    def insert(self, id: str, metadata: Mapping[str, object]) -> None:
+        self.drop(id)
+        self.impactCache.clear()
+        number = len(self.ids)
+        name, desc, tags, sku = TextIndex.fields(id, metadata)
+        # the separator keeps substring matches from spanning the name and description
+        text = name + "\0" + desc
+        counts = TextIndex.terms(name, desc, tags, sku)
+        for token, count in counts.items():
+            docs, freqs = self.postings.setdefault(token, (array("I"), array("I")))
+            docs.append(number)
+            freqs.append(count)
+            self.documentFrequency[token] = self.documentFrequency.get(token, 0) + 1
+        for gram in trigrams(text):
+            self.grams.setdefault(gram, array("I")).append(number)
+        for tag in set(tags):
+            self.tagDocs.setdefault(tag, array("I")).append(number)
+        self.skus[sku] = number
+        self.suggestions(id, metadata, self.prefixes.add)
+        self.ids.append(id)
+        self.numbers[id] = number
+        self.metadatas.append(dict(metadata))
+        self.texts.append(text)
+        price = metadata.get("price")
+        self.prices.append(float(price) if isinstance(price, (int, float)) else math.nan)
+        self.availability.append(1 if metadata.get("available", True) else 0)
+        length = sum(counts.values())
+        self.lengths.append(length)
+        self.totalLength += length
+        self.alive.append(1)
+
+    def drop(self, id: str) -> None:
+        number = self.numbers.pop(id, None)
+        if number is None:
+            return
+        self.impactCache.clear()
+        name, desc, tags, sku = TextIndex.fields(id, self.metadatas[number]) # type: ignore
+        for token in TextIndex.terms(name, desc, tags, sku):
+            self.documentFrequency[token] -= 1
+        if self.skus.get(sku) == number:
+            del self.skus[sku]
+        self.suggestions(id, self.metadatas[number], self.prefixes.discard) # type: ignore
+        self.ids[number] = None
+        self.metadatas[number] = None
+        self.texts[number] = ""
+        self.totalLength -= self.lengths[number]
+        self.alive[number] = 0
+        self.deleted += 1
+        if self.deleted > 1024 and self.deleted > len(self.ids) // 2:
+            self.compact()
+
+    def compact(self) -> None:
+        fresh = TextIndex()
+        for number, id in enumerate(self.ids):
+            if id is not None:
+                fresh.insert(id, self.metadatas[number]) # type: ignore
+        self.__dict__.update((key, value) for key, value in fresh.__dict__.items() if key not in LOG_STATE)
+
+    def impacts(self, token: str) -> tuple[np.ndarray, np.ndarray]:
+        # each live posting's BM25 contribution, worked out once per token until the index changes
+        cached = self.impactCache.get(token)
+        if cached is None:
+            docs, freqs = (np.frombuffer(a, dtype=np.uint32) for a in self.postings[token])
+            if self.deleted > 0:
+                live = np.frombuffer(self.alive, dtype=np.uint8)[docs] == 1
+                docs, freqs = docs[live], freqs[live]
+            total = len(self.numbers)
+            lengthNorm = self.k1 * (1 - self.b + self.b * np.frombuffer(self.lengths, dtype=np.uint32)[docs] / max(self.totalLength / max(total, 1), 1))
+            df = self.documentFrequency[token]
+            idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+            cached = (docs, (idf * freqs * (self.k1 + 1) / (freqs + lengthNorm)).astype(np.float32))
+            self.impactCache[token] = cached
+        return cached
+
+    def tokenMatches(self, query: str) -> tuple[np.ndarray, np.ndarray]:
+        # products holding every token of the query, with their summed BM25 scores
+        tokens = set(tokenise(query))
+        if len(tokens) == 0 or any(token not in self.postings for token in tokens):
+            return emptyHits, np.zeros(0, dtype=np.float32)
+        postings = sorted((self.impacts(token) for token in tokens), key=lambda posting: len(posting[0]))
+        hits, scores = postings[0]
+        for docs, impacts in postings[1:]:
+            # scattered over every document number, so each hit is one lookup; impacts are always positive, so 0 means absent
+            dense = np.zeros(len(self.ids), dtype=np.float32)
+            dense[docs] = impacts
+            found = dense[hits]
+            keep = found > 0
+            hits, scores = hits[keep], scores[keep] + found[keep]
+        return hits, scores
+
+    def substringMatches(self, q: str, exclude: np.ndarray, needed: int | None, filters: SearchFilters | None) -> np.ndarray:
+        # products whose name or description holds the query without matching all of its tokens, e.g. "sams"
+        grams = trigrams(q)
+        if len(q) < 3 or any(g not in self.grams for g in grams):
+            return emptyHits
+        postings = sorted((np.frombuffer(self.grams[g], dtype=np.uint32) for g in grams), key=len)
+        found: list[int] = []
+        # the rarest trigram is walked a block at a time, so the check stops once enough products are found
+        for start in range(0, len(postings[0]), SUBSTRING_BLOCK):
+            candidates = postings[0][start:start + SUBSTRING_BLOCK]
+            for p in postings[1:]:
+                candidates = candidates[p[np.minimum(np.searchsorted(p, candidates), len(p) - 1)] == candidates]
+            candidates = candidates[np.frombuffer(self.alive, dtype=np.uint8)[candidates] == 1]
+            candidates = candidates[~np.isin(candidates, exclude)]
+            if filters is not None and not filters.empty():
+                candidates = self.filter(candidates, filters)
+            for n in candidates.tolist():
+                if q in self.texts[n]:
+                    found.append(n)
+                    if len(found) == needed:
+                        return np.array(found, dtype=np.uint32)
+        return np.array(found, dtype=np.uint32)
+
+    def score(self, query: str, hits: np.ndarray) -> np.ndarray:
+        scores = np.zeros(len(hits), dtype=np.float32)
+        if len(hits) == 0:
+            return scores
+        for token in set(tokenise(query)):
+            if token not in self.postings:
+                continue
+            docs, impacts = self.impacts(token)
+            if len(docs) == 0:
+                continue
+            positions = np.minimum(np.searchsorted(docs, hits), len(docs) - 1)
+            scores += np.where(docs[positions] == hits, impacts[positions], 0)
+        return scores
+
+    def keep(self, hits: np.ndarray, filters: SearchFilters) -> np.ndarray:
+        keep = np.ones(len(hits), dtype=bool)
+        prices = np.frombuffer(self.prices, dtype=np.float64)[hits]
+        if filters.minPrice is not None:
+            keep &= prices >= filters.minPrice
+        if filters.maxPrice is not None:
+            keep &= prices <= filters.maxPrice
+        if filters.available is not None:
+            keep &= (np.frombuffer(self.availability, dtype=np.uint8)[hits] == 1) == filters.available
+        for tag in filters.tags:
+            keep &= self.tagged(tag)[hits]
+        for tag in filters.excludeTags:
+            keep &= ~self.tagged(tag)[hits]
+        return keep
+
+    def tagged(self, tag: str) -> np.ndarray:
+        tagged = np.zeros(len(self.ids), dtype=bool)
+        tagged[np.frombuffer(self.tagDocs.get(tag.strip().lower(), array("I")), dtype=np.uint32)] = True
+        return tagged
+
+    def filter(self, hits: np.ndarray, filters: SearchFilters) -> np.ndarray:
+        return hits[self.keep(hits, filters)]
+
+    def lookupSku(self, sku: str, filters: SearchFilters | None = None) -> str | None:
+        number = self.skus.get(sku.strip().lower())
+        if number is None or (filters is not None and not filters.empty() and len(self.filter(np.array([number], dtype=np.uint32), filters)) == 0):
+            return None
+        return self.ids[number]
+
+    def search(self, query: str, limit: int | None = None, filters: SearchFilters | None = None) -> list[tuple[str, float]]:
+        q = query.lower().strip()
+        if q == "":
+            return []
+        hits, scores = self.tokenMatches(q)
+        # a tag of several words, or with punctuation, isn't among the token matches, so it matches as the whole query
+        if q in self.postings and tokenise(q) != [q]:
+            docs, impacts = self.impacts(q)
+            new = ~np.isin(docs, hits)
+            hits, scores = np.concatenate([hits, docs[new]]), np.concatenate([scores, impacts[new]])
+        # filtered before ranking, so the limit is filled with products that qualify
+        if filters is not None and not filters.empty():
+            keep = self.keep(hits, filters)
+            hits, scores = hits[keep], scores[keep]
+        # SKUs may be spelled in ways that aren't among the token matches
+        extra = emptyHits
+        if q in self.skus and not np.isin(self.skus[q], hits):
+            extra = np.array([self.skus[q]], dtype=np.uint32)
+            if filters is not None and not filters.empty():
+                extra = self.filter(extra, filters)
+        # substrings are only looked for while the limit isn't filled yet
+        needed = None if limit is None else limit - len(hits) - len(extra)
+        if needed is None or needed > 0:
+            extra = np.concatenate([extra, self.substringMatches(q, np.concatenate([hits, extra]), needed, filters)])
+        if len(extra) > 0:
+            hits, scores = np.concatenate([hits, extra]), np.concatenate([scores, self.score(q, extra)])
+        top = np.arange(len(hits))
+        if limit is not None and len(hits) > limit:
+            top = np.argpartition(-scores, limit - 1)[:limit]
+        order = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.ids[hits[i]], float(scores[i])) for i in order.tolist()] # type: ignore
+
+    def save(self, path: str) -> None:
+        try:
+            current = readHeader(path).get("lineage") == self.lineage
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            current = False
+        # changes are appended to a log beside the file, so a save costs what changed rather than the whole index
+        if current and len(self.journal) > 0:
+            with open(path + ".log", "ab") as file:
+                file.write(b"".join(pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL) for entry in self.journal))
+            self.logged += len(self.journal)
+        self.journal = []
+        if current and self.logged <= max(COMPACT_MIN, len(self.numbers) * COMPACT_RATIO):
+            return
+        with open(path + ".tmp", "wb") as file:
+            pickle.dump({"lineage": self.lineage, "sequence": self.sequence}, file, protocol=pickle.HIGHEST_PROTOCOL)
+            # the impact cache is rebuilt by searches, so it isn't saved
+            pickle.dump({key: value for key, value in self.__dict__.items() if key not in LOG_STATE and key != "impactCache"}, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+        # kept for a while, so readers that hadn't caught up can still finish it
+        if os.path.isfile(path + ".log"):
+            os.replace(path + ".log", path + ".log.old")
+        self.logged = 0
+
+    def replay(self, path: str, offset: int = 0, lock: AbstractContextManager | None = None) -> tuple[int, bool]:
+        # applies the log's records that follow this index's sequence, returning where it stopped and whether the log carried on from the index
+        with open(path, "rb") as file:
+            file.seek(offset)
+            while True:
+                try:
+                    sequence, change = pickle.load(file)
+                except (EOFError, pickle.UnpicklingError):
+                    # the end, or a record that is still being written
+                    return offset, True
+                if sequence > self.sequence + 1:
+                    return offset, False
+                if sequence == self.sequence + 1:
+                    if lock is None:
+                        self.apply(sequence, change)
+                    else:
+                        with lock:
+                            self.apply(sequence, change)
+                offset = file.tell()
+
+    @classmethod
+    def load(cls, path: str, log: bool = True) -> "TextIndex":
+        index = cls()
+        with open(path, "rb") as file:
+            header = pickle.load(file)
+            # files written before the log existed hold the state alone
+            state = header if "ids" in header else pickle.load(file)
+        index.__dict__.update(state)
+        index.impactCache = {}
+        if "ids" not in header:
+            index.lineage, index.sequence = header["lineage"], header["sequence"]
+            if log and os.path.isfile(path + ".log"):
+                index.replay(path + ".log")
+            index.logged = index.sequence - header["sequence"]
+        # indexes saved before the filter columns or completions existed, or in an older format, are rebuilt from their metadata
+        if "prices" not in state or "prefixes" not in state or state.get("format") != FORMAT:
+            index.compact()
+        return index
+
+class TextIndexFile:
+    # the server's copy of the index, kept up to date off the request path by following the log the management CLI appends to
+    def __init__(self, path: str, version: Callable[[], int]) -> None:
+        self.path = path
+        # the catalog version, and the one whose writes the index is known to hold
+        self.version = version
+        self.applied = version()
+        # held by searches and by each change applied, as changes resize the arrays searches read;
+        # never taken before the refresh lock, since a refresh takes it for every change
+        self.lock = threading.RLock()
+        self.refreshing = threading.Lock()
+        self.baseStat: tuple[int, int] | None = None
+        self.logInode: int | None = None
+        self.logOffset = 0
+        self.index = TextIndex()
+        self.reload()
+
+    def current(self) -> TextIndex:
+        # writes the watcher hasn't got to yet are applied first, so no search runs on an index older than the catalog version it is cached under
+        if self.version() != self.applied:
+            self.refresh()
+        return self.index
+
+    def reload(self) -> None:
+        try:
+            stat = os.stat(self.path)
+            index = TextIndex.load(self.path, log=False)
+        except FileNotFoundError:
+            return
+        self.baseStat = (stat.st_ino, stat.st_mtime_ns)
+        self.logInode, self.logOffset = None, 0
+        # one assignment, so searches holding the old index finish with it, then the log is caught up with
+        self.index = index
+        self.follow()
+
+    def follow(self) -> bool:
+        try:
+            live = os.stat(self.path + ".log").st_ino
+        except FileNotFoundError:
+            live = None
+        for name in (self.path + ".log.old", self.path + ".log"):
+            try:
+                inode = os.stat(name).st_ino
+            except FileNotFoundError:
+                continue
+            # the rotated log was finished before moving on to the live one
+            if name.endswith(".old") and live is not None and live == self.logInode:
+                continue
+            offset, contiguous = self.index.replay(name, self.logOffset if inode == self.logInode else 0, self.lock)
+            if not contiguous:
+                return False
+            self.logInode, self.logOffset = inode, offset
+        return True
+
+    def refresh(self) -> None:
+        # read before the files, and writers save the index before bumping the version, so every write it counts is on disk by then
+        version = self.version()
+        with self.refreshing:
+            self.update()
+            self.applied = version
+
+    def update(self) -> None:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if (stat.st_ino, stat.st_mtime_ns) != self.baseStat:
+            # rewritten: either compacted, which the log has already carried here, or replaced by a different index
+            header = readHeader(self.path)
+            if header.get("lineage") != self.index.lineage or not self.follow() or self.index.sequence < header["sequence"]: # type: ignore
+                print("Text index was replaced, reloading it.")
+                self.reload()
+                return
+            self.baseStat = (stat.st_ino, stat.st_mtime_ns)
+        elif not self.follow():
+            self.reload()
+
+    def watch(self, interval: float) -> None:
+        while True:
+            time.sleep(interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Couldn't refresh the text index: {e}")